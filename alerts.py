@@ -2,11 +2,109 @@
 # -*- coding: utf-8 -*-
 """
 """
-import datetime
-import pytz
+import time
 import numpy as np
 import cv2
 import queue
+from frames import downscale_gray, tile_grid
+from pipeline import offload
+
+
+class SlidingWindow:
+    """Running sum and mean of the values of the last ``seconds``, updated in O(1) per sample."""
+    def __init__(self, seconds=30):
+        self.seconds = seconds
+        self.reset()
+
+    def reset(self):
+        self._samples = queue.deque()
+        self.sum = 0.0
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, timestamp, value):
+        self._samples.append((timestamp, value))
+        self.sum += value
+        self.expire(timestamp)
+
+    def expire(self, now):
+        samples = self._samples
+        while samples and now - samples[0][0] > self.seconds:
+            self.sum -= samples.popleft()[1]
+        if not samples:
+            # Rundungsfehler nicht über leere Fenster hinweg mitschleppen
+            self.sum = 0.0
+
+    def mean(self):
+        return self.sum / len(self._samples) if self._samples else 0.0
+
+
+class SlidingArea:
+    """
+    Trapezoidal area under the samples of the last ``seconds``, updated in
+    O(1) per sample. Like ``np.trapz`` over a filtered series, consecutive
+    added samples are joined regardless of the samples filtered out between them.
+    """
+    def __init__(self, seconds=30):
+        self.seconds = seconds
+        self.reset()
+
+    def reset(self):
+        self._samples = queue.deque()
+        self.area = 0.0
+
+    def add(self, timestamp, value):
+        if self._samples:
+            t0, v0 = self._samples[-1]
+            self.area += (timestamp - t0) * (value + v0) / 2
+        self._samples.append((timestamp, value))
+
+    def expire(self, now):
+        samples = self._samples
+        while samples and now - samples[0][0] > self.seconds:
+            t0, v0 = samples.popleft()
+            if samples:
+                t1, v1 = samples[0]
+                self.area -= (t1 - t0) * (v1 + v0) / 2
+        if len(samples) < 2:
+            self.area = 0.0
+
+
+def blur_gray(gray_frame, scale=1):
+    """Gaussian blur against sensor noise, with a smaller kernel on downscaled frames."""
+    kernel = (5, 5) if scale == 1 else (3, 3)
+    return cv2.GaussianBlur(gray_frame, kernel, 0)
+
+
+def frame_diff_ratio(last_frame, frame, diff_threshold=3):
+    """Share of pixels whose value changed by more than ``diff_threshold`` between two preprocessed frames."""
+    # Berechne die Differenz zwischen dem aktuellen und dem letzten Frame
+    frame_diff = cv2.absdiff(last_frame, frame)
+
+    # Schwellwert anwenden, um nur signifikante Änderungen zu berücksichtigen
+    _, thresh = cv2.threshold(frame_diff, diff_threshold, 255, cv2.THRESH_BINARY)
+
+    # Zähle die Anzahl der nicht-null Pixel in der Differenzmatrix
+    diff_value = cv2.countNonZero(thresh)
+
+    # Berechne die Gesamtanzahl der Pixel im Bild
+    total_pixels = frame.shape[0] * frame.shape[1]  # Höhe * Breite
+
+    # Berechne den Anteil der Pixel mit Differenz
+    return diff_value / total_pixels if total_pixels > 0 else 0
+
+
+def changed_tiles(last_frame, frame, cols, rows, diff_threshold=3, min_ratio=0.01):
+    """Boolean ``rows`` x ``cols`` array of the tiles whose share of changed pixels exceeds ``min_ratio``."""
+    changed = (cv2.absdiff(last_frame, frame) > diff_threshold).astype(np.int32)
+    ys = tile_grid(frame.shape[0], rows)
+    xs = tile_grid(frame.shape[1], cols)
+    # Summe je Kachel: erst über die Zeilenbänder, dann über die Spalten
+    sums = np.add.reduceat(np.add.reduceat(changed, ys[:-1], axis=0), xs[:-1], axis=1)
+    areas = np.outer(np.diff(ys), np.diff(xs))
+    return sums > min_ratio * np.maximum(areas, 1)
+
 
 class AlertEntity:
     def __init__(self, **kwargs):
@@ -24,60 +122,56 @@ class VideoAlert(AlertEntity):
         super().__init__(**kwargs)
         self._last_frame = None
         self._frame_diff = None
-        self._default_threshold = 0.07
-        self._threshold = 0.07
+        # Anteil bewegter Pixel im 30-s-Mittel; bei 1/4 Auflösung liegt Sensorrauschen weit darunter
+        self._default_threshold = kwargs.get('threshold', 0.07)
+        self._threshold = self._default_threshold
+        self._diff_threshold = kwargs.get('diff_threshold', 3)
+        # Bewegungsanalyse auf 1/analysis_scale der Auflösung
+        self.analysis_scale = kwargs.get('analysis_scale', 4)
+        self._window = SlidingWindow(seconds=kwargs.get('window', 30))
         self._init_queue()
         
     def _init_queue(self):
         self._frame_queue = queue.deque(maxlen=300)
+        self._window.reset()
         
     def _set_baseline(self):
         self._threshold = self._default_threshold
         self._init_queue()       
-        
-    def add_frame(self, frame):
-        # Konvertiere den Frame in Graustufen
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
+    def gray(self, frame):
+        # Graustufen in Analyseauflösung, bei Frames mit JPEG direkt reduziert dekodiert
+        if hasattr(frame, 'gray'):
+            return frame.gray(self.analysis_scale)
+        return downscale_gray(frame, self.analysis_scale)
+
+    def _preprocess(self, frame):
         # Wende Gaussian Blur an, um Rauschen zu reduzieren
-        blurred_frame = cv2.GaussianBlur(gray_frame, (5, 5), 0)
+        return offload(blur_gray, self.gray(frame), self.analysis_scale)
         
-        if self._last_frame is not None:
-            # Berechne die Differenz zwischen dem aktuellen und dem letzten Frame
-            gray_last_frame = cv2.cvtColor(self._last_frame, cv2.COLOR_BGR2GRAY)
-            blurred_last_frame = cv2.GaussianBlur(gray_last_frame, (7, 7), 0)
-            frame_diff = cv2.absdiff(blurred_last_frame, blurred_frame)
-
-            # Schwellwert anwenden, um nur signifikante Änderungen zu berücksichtigen
-            _, thresh = cv2.threshold(frame_diff, 3, 255, cv2.THRESH_BINARY)
-
-            # Zähle die Anzahl der nicht-null Pixel in der Differenzmatrix
-            diff_value = cv2.countNonZero(thresh)
-    
-            # Berechne die Gesamtanzahl der Pixel im Bild
-            total_pixels = frame.shape[0] * frame.shape[1]  # Höhe * Breite
-    
-            # Berechne den Anteil der Pixel mit Differenz
-            diff_ratio = diff_value / total_pixels if total_pixels > 0 else 0
+    def add_frame(self, frame):
+        # Jeder Frame wird nur einmal vorverarbeitet und für den nächsten Vergleich behalten
+        blurred_frame = self._preprocess(frame)
+        
+        if self._last_frame is not None and self._last_frame.shape == blurred_frame.shape:
+            diff_ratio = offload(frame_diff_ratio, self._last_frame, blurred_frame, self._diff_threshold)
+            self.add_diff(time.time(), diff_ratio)
 
-            # Speichere das Ergebnis mit Zeitstempel in der Queue
-            timestamp = datetime.datetime.now(pytz.timezone('Europe/Berlin')).isoformat()
-            self._frame_queue.append((timestamp, diff_ratio))
+        # Speichere den vorverarbeiteten Frame als letzten Frame
+        self._last_frame = blurred_frame
 
-        # Speichere den aktuellen Frame als letzten Frame
-        self._last_frame = frame
-        
+    def add_diff(self, timestamp, diff_ratio):
+        # Speichere das Ergebnis mit Zeitstempel (Epoch) in der Queue
+        self._frame_queue.append((timestamp, diff_ratio))
+        self._window.add(timestamp, diff_ratio)
         self._evaluate()
 
     def _evaluate(self):
-        try:
-            video_data = self.get_frame_diffs()
-            now = datetime.datetime.fromisoformat(video_data[-1][0])
-            levels = [data[1] for data in video_data if now - datetime.datetime.fromisoformat(data[0]) <= datetime.timedelta(seconds=30)]
-            self.alert_level = float(np.mean(levels))
-            self.status = self.alert_level > self._threshold
-        except:
-            pass
+        # Mittelwert der letzten 30 Sekunden, laufend nachgeführt
+        if len(self._window) == 0:
+            return
+        self.alert_level = float(self._window.mean())
+        self.status = self.alert_level > self._threshold
 
     def get_frame_diffs(self):
         return list(self._frame_queue)
@@ -86,8 +180,14 @@ class VideoAlert(AlertEntity):
 class AudioAlert(AlertEntity):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self._data = None
+        self.data = None
         self._threshold = kwargs.get('threshold', 0.4)
+        window = kwargs.get('window', 30)
+        self._above = SlidingArea(seconds=window)
+        self._below = SlidingArea(seconds=window)
+        self._positive = SlidingWindow(seconds=window)
+        self._seen = 0
+        self._samples = 0
     
     def evaluate(self, data):
         self._set_data(data)
@@ -95,47 +195,57 @@ class AudioAlert(AlertEntity):
         
     def set_threshold(self, threshold):
         self._threshold = threshold
+
+    def reset(self):
+        self._above.reset()
+        self._below.reset()
+        self._positive.reset()
+        self._seen = 0
+        self._samples = 0
         
     def _set_data(self, data):
+        # Nur die seit dem letzten Aufruf neuen Chunks übernehmen
+        # count nur einmal lesen, der Monitor hängt parallel an
+        count = data.count
+        if data is not self.data or count < self._seen:
+            self.reset()
         self.data = data
+        times, levels = data.since(self._seen, count)
+        self._seen = count
+        self.add_samples(times, levels)
+
+    def add_samples(self, times, levels):
+        for timestamp, level in zip(times.tolist(), levels.tolist()):
+            if level > 0:
+                self._above.add(timestamp, level)
+            elif level < 0:
+                self._below.add(timestamp, level)
+            self._positive.add(timestamp, 1.0 if level > 0 else 0.0)
+            self._samples += 1
+        if len(times):
+            now = times[-1]
+            self._above.expire(now)
+            self._below.expire(now)
         
     def _evaluate(self):
-        try:
-            if len(self.data)<=10:
-                return
-            
-            now = datetime.datetime.fromisoformat(self.data[-1]['time'])
-            # Filtere die Daten der letzten 30 Sekunden
-            recent_data = [data for data in self.data if now - datetime.datetime.fromisoformat(data['time']) <= datetime.timedelta(seconds=30)]
-            
-            if not recent_data:
-                self.alert_level = 0
-                self.status = False
-                return
-            
-            # Extrahiere die Zeit- und Levelwerte
-            times = np.array([datetime.datetime.fromisoformat(data['time']).timestamp() for data in recent_data])
-            levels = np.array([data.get('level', 0) for data in recent_data])
-            
-            # Berechne die Flächen
-            area_above = np.trapz(levels[levels > 0], times[levels > 0])
-            area_below = np.trapz(levels[levels < 0], times[levels < 0])
-            
-            # Bestimme den Anteil
-            total_area = abs(area_above) + abs(area_below)
-            self.alert_level = area_above / total_area if total_area > 0 else 0
-            self.status = self.alert_level > self._threshold
-        except Exception as e:
-            print(f"Error during evaluation: {e}")
+        if self._samples<=10:
+            return
+        
+        if len(self._positive) == 0:
+            self.alert_level = 0
+            self.status = False
+            return
+
+        # Bestimme den Anteil der Fläche oberhalb der Alarmschwelle
+        area_above = self._above.area
+        area_below = self._below.area
+        total_area = abs(area_above) + abs(area_below)
+        self.alert_level = float(area_above / total_area) if total_area > 0 else 0
+        self.status = self.alert_level > self._threshold
 
     def _evaluate_lin(self):
-        try:
-            now = datetime.datetime.fromisoformat(self.data[-1]['time'])
-            levels = [data.get('level') for data in self.data if now - datetime.datetime.fromisoformat(data['time']) <= datetime.timedelta(seconds=30)]
-            self.alert_level = float(np.sum(np.array(levels) > 0) / len(levels) if len(levels) > 0 else 0)
-            self.status = self.alert_level > self._threshold
-        except:
-            pass
+        self.alert_level = float(self._positive.mean())
+        self.status = self.alert_level > self._threshold
 
 
 class AlertFrame:
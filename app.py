@@ -1,145 +1,446 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-from flask import Flask, render_template, Response, stream_with_context, request, send_from_directory, jsonify
-from flask_socketio import SocketIO, emit
-from threading import Thread, Event
+from flask import Flask, render_template, Response, stream_with_context, request, send_from_directory, jsonify, abort
+from flask_socketio import SocketIO, emit, join_room
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock
 import time
-from dateutil import parser
+import itertools
+import functools
+import hmac
 from streams import *
 from alerts import *
-import base64
-import pytz
-import wave
+from pipeline import LatestValue, PipelineStage, PooledStage, ClientState, QUALITY_MAPPING, green, offload
+from frames import Frame, tile_grid
+from motion import MotionProcessPool
+from recorder import ClipRecorder
+from timeseries import TimeSeriesStore
+from metrics import REGISTRY, STAGE, EMIT, EMIT_BYTES
+from profiling import SamplingProfiler, AllocationTracker
 
 
 class GenerateFrames:
-    def __init__(self, socketio=None, cam=None):
+    def __init__(self, socketio=None, cam=None, quality_mapping=None, motion_scale=4, motion_threshold=None,
+                 name='default', executor=None, motion_pool=None, recorder=None, record_quality=None, history=None,
+                 idle=None, delta=None):
         self.cam = cam
         self.socketio = socketio
+        self.name = name
+        # alle Clients dieser Kamera, für Alarm- und Statusmeldungen
+        self.room = f'camera/{name}'
+        # gemeinsamer Worker-Pool für die Analyse aller Kameras
+        self.executor = executor
+        self.quality_mapping = dict(quality_mapping or QUALITY_MAPPING)
+        if getattr(cam, 'passthrough', False) and 100 not in self.quality_mapping.values():
+            # fast clients get the camera's original JPEG without re-encoding
+            self.quality_mapping[min(self.quality_mapping) / 2] = 100
         self.clients = dict()
         self.running = Event()
-        self.thread = None
+        # Versand an Clients, läuft nur solange jemand zusieht
+        self.viewing = Event()
+        self._broadcast = None
+        # Connect/Disconnect kommen aus verschiedenen Handlern
+        self._lock = Lock()
+        # ein Stage, der z.B. in einem Kamera-Timeout hängt, hält den Handler nicht auf
+        self.join_timeout = 2
+        self.stages = []
+        self._frame_ids = itertools.count(1)
         self.alert = False
+        # über Neustarts der Pipeline summiert, für /metrics
+        self.dropped = dict()
+        self.skipped = 0
         
         self._alert_a = AudioAlert(threshold=0.4)
-        self._alert_v = VideoAlert()
+        threshold, diff_threshold = motion_threshold or (0.07, 3)
+        self._alert_v = VideoAlert(analysis_scale=motion_scale, threshold=threshold, diff_threshold=diff_threshold)
         self._alert = AlertFrame()
         self._alert.add_alert_entity(self._alert_a)
         self._alert.add_alert_entity(self._alert_v)
 
+        # optional: Clips mit Vorlauf bei Alarm aufzeichnen
+        self.recorder = recorder
+        # volle Auflösung: Passthrough-Original bzw. einmal in voller Größe kodiert; record.quality < 100 verkleinert
+        self.record_quality = record_quality or 100
+        if self.recorder is not None:
+            self.cam.audio_fanout.add_callback(lambda chunk: self.recorder.add_audio(time.time(), chunk))
+
+        # Verlauf der Alarmpegel auf der Platte
+        self.history = history
+        # Aufzeichnung und Verlauf brauchen die Analyse auch ohne Zuschauer
+        self.persistent = self.recorder is not None or self.history is not None
+
+        # unveränderte Frames nur alle keepalive Sekunden senden
+        self.idle = idle if idle and idle.get('enabled', True) != False else None
+        self.unchanged = 0
+
+        # Kachelraster für Delta-Clients, verglichen in Analyseauflösung
+        self.delta = delta or {'cols': 8, 'rows': 6, 'keyframe': 10, 'max_share': 0.5,
+                               'diff_threshold': 8, 'min_ratio': 0.01}
+        self.motion_scale = motion_scale
+
+        # optional: Bewegungsanalyse in Worker-Prozessen
+        self.motion_pool = motion_pool
+        if self.motion_pool is not None:
+            self.motion_pool.register(self.name, self._alert_v.add_diff,
+                                      diff_threshold=self._alert_v._diff_threshold, scale=motion_scale)
+
+    def _init_pipeline(self):
+        for stage in self.stages:
+            self.dropped[stage.name] = self.dropped.get(stage.name, 0) + stage.dropped
+        self._frames = LatestValue()
+        self._audio = LatestValue()
+        self._audio_count = None
+        self._video_seq = 0
+        self.stages = [
+            PipelineStage('video_capture', self._capture_video, thread_name=f'{self.name}-video_capture'),
+            PipelineStage('audio_capture', self._capture_audio, interval=0.1, thread_name=f'{self.name}-audio_capture'),
+            self._analysis_stage('motion', self._analyse_motion, self._frames),
+            self._analysis_stage('audio_alert', self._analyse_audio, self._audio),
+            self._analysis_stage('record', self._record_frame, self._frames) if self.recorder is not None else None,
+            PipelineStage('alert', self._broadcast_alert, interval=0.25, thread_name=f'{self.name}-alert'),
+        ]
+        self.stages = [stage for stage in self.stages if stage is not None]
+        for stage in self.stages:
+            stage.observe = STAGE.labels(self.name, stage.name).observe
+        self._emit = {mode: (EMIT.labels(self.name, mode).observe, EMIT_BYTES.labels(self.name, mode).observe)
+                      for mode in ('binary', 'base64', 'delta')}
+
+    def _analysis_stage(self, name, step, source):
+        if self.executor is not None:
+            return PooledStage(name, step, source, self.executor)
+        return PipelineStage(name, step, source=source, thread_name=f'{self.name}-{name}')
+
     def start(self):
-        if not self.running.is_set():
-            self.running.set()
-            self.thread = Thread(target=self._generate_frames)
-            self.thread.start()
+        """Starts capture and analysis; the broadcast stage only while clients are connected."""
+        with self._lock:
+            if not self.running.is_set():
+                # neues Event: ein beim Stoppen nicht rechtzeitig beendeter Stage läuft nicht wieder an
+                self.running = Event()
+                self.running.set()
+                self._init_pipeline()
+                for stage in self.stages:
+                    stage.start(self.running)
+            if self.clients and not self.viewing.is_set():
+                self.viewing = Event()
+                self.viewing.set()
+                self._broadcast = PipelineStage('broadcast', self._broadcast_frame, source=self._frames,
+                                                thread_name=f'{self.name}-broadcast')
+                self._broadcast.observe = STAGE.labels(self.name, 'broadcast').observe
+                self._broadcast.start(self.viewing)
+                self.stages.append(self._broadcast)
 
-    def stop(self):
+    def _stop_broadcast(self):
+        self.viewing.clear()
+        stage, self._broadcast = self._broadcast, None
+        if stage is not None:
+            stage.join(self.join_timeout)
+            self.stages.remove(stage)
+            self.dropped[stage.name] = self.dropped.get(stage.name, 0) + stage.dropped
+
+    def _stop(self):
+        self._stop_broadcast()
         self.running.clear()
-        if self.thread is not None:
-            self.thread.join()
+        for stage in self.stages:
+            stage.join(self.join_timeout)
+
+    def stop(self):
+        with self._lock:
+            self._stop()
+
+    def stats(self):
+        return {
+            'camera': self.cam.status(),
+            'recorder': self.recorder.stats() if self.recorder is not None else None,
+            'history': self.history.stats() if self.history is not None else None,
+            'motion_pool': self.motion_pool.stats() if self.motion_pool is not None else None,
+            'stages': {stage.name: stage.stats() for stage in self.stages},
+            'clients': {sid: state.stats() for sid, state in self.clients.copy().items()},
+        }
     
-    def _compress_frame(self, frame=None, quality=100):
-        if quality!=100:
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
-            scale_factor = np.sqrt(quality / 100)
-            new_width = int(frame.shape[1] * scale_factor)
-            new_height = int(frame.shape[0] * scale_factor)
-            
-            resized_frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_AREA)
+    def _capture_video(self):
+        seq, frame, stale = self.cam.wait_frame(self._video_seq, timeout=1)
+        if seq == self._video_seq or frame is None:
+            return
+        self._video_seq = seq
+        if isinstance(frame, bytes):
+            self._frames.put(Frame(jpeg=frame))
+        else:
+            self._frames.put(Frame(frame))
+
+    def _capture_audio(self):
+        _, audio_data, stale = self.cam.wait_audio(timeout=1)
+        if audio_data is None:
+            return
+        # nur weitergeben, wenn neue Chunks angekommen sind
+        key = (id(audio_data), audio_data.count)
+        if key != self._audio_count:
+            self._audio_count = key
+            self._audio.put(audio_data)
 
-            _, buffer = cv2.imencode('.jpg', resized_frame, encode_param)
+    def _analyse_motion(self, frame):
+        if self.motion_pool is not None:
+            # dekodiert wird im Worker: das Original-JPEG oder der volle Frame über Shared Memory
+            self.motion_pool.submit(self.name, frame.timestamp, jpeg=frame.source,
+                                    image=None if frame.source is not None else frame.image)
         else:
-            _, buffer = cv2.imencode('.jpg', frame)
-        encoded = base64.b64encode(buffer).decode('utf-8')
-        return encoded
-
-    def _generate_frames(self):
-        quality_mapping = {
-            0.1: 70,
-            1: 50,
-            2: 20,
-            5: 10,
-        }
-        while self.running.is_set():
-            self.cam.a.start_monitoring()
-            now = datetime.datetime.now(pytz.timezone('Europe/Berlin')).isoformat()
+            self._alert_v.add_frame(frame)
+
+    def _analyse_audio(self, audio_data):
+        if len(audio_data):
+            self._alert_a.evaluate(audio_data)
+
+    def _record_frame(self, frame):
+        # mit schnellen Clients in derselben Stufe, also oft schon kodiert
+        self.recorder.add_frame(frame.timestamp, frame.jpeg(self.record_quality))
+
+    def _thumbnail(self, frame):
+        scale = self.idle['scale']
+        return offload(blur_gray, frame.gray(scale), scale)
+
+    def _unchanged(self, state, thumbnail):
+        """True if the scene did not change since the last frame sent to this client and no keepalive is due."""
+        if state.reference is None or state.reference.shape != thumbnail.shape:
+            return False
+        if time.time() - state.last_sent >= self.idle['keepalive']:
+            return False
+        # bei Bewegungsalarm immer volle Rate
+        if self._alert_v.get_status():
+            return False
+        ratio = frame_diff_ratio(state.reference, thumbnail, self.idle['diff_threshold'])
+        return ratio <= self.idle['min_ratio']
+
+    def _tile_gray(self, frame):
+        return offload(blur_gray, frame.gray(self.motion_scale), self.motion_scale)
+
+    def _changed_tiles(self, state, gray, quality):
+        """Changed tiles since the client's reference, or None if a keyframe is due."""
+        if state.tiles is None or state.tiles.shape != gray.shape or state.key_quality != quality:
+            return None
+        if time.time() - state.key_sent >= self.delta['keyframe']:
+            return None
+        changed = changed_tiles(state.tiles, gray, self.delta['cols'], self.delta['rows'],
+                                self.delta['diff_threshold'], self.delta['min_ratio'])
+        # viele kleine JPEGs sind größer als ein ganzes
+        if changed.mean() > self.delta['max_share']:
+            return None
+        return changed
+
+    def _delta_frame(self, frame, state, gray, quality, changed):
+        if changed is None:
+            state.tiles = gray.copy()
+            state.key_sent = time.time()
+            state.key_quality = quality
+            state.keyframes += 1
+            return {'key': True, 'data': frame.jpeg(quality)}
+        cols, rows = self.delta['cols'], self.delta['rows']
+        ys = tile_grid(gray.shape[0], rows)
+        xs = tile_grid(gray.shape[1], cols)
+        tiles = []
+        for row, col in zip(*np.nonzero(changed)):
+            # nur die gesendeten Kacheln nachführen, kleine Änderungen summieren sich sonst unbemerkt
+            state.tiles[ys[row]:ys[row + 1], xs[col]:xs[col + 1]] = gray[ys[row]:ys[row + 1], xs[col]:xs[col + 1]]
+            x, y, jpeg = frame.tile(quality, cols, rows, int(col), int(row))
+            tiles.append({'x': x, 'y': y, 'data': jpeg})
+        return {'key': False, 'tiles': tiles}
+
+    def _broadcast_frame(self, frame):
+        now = frame.time
+        thumbnail = None
+        gray = None
+        
+        for client, state in self.clients.copy().items():
+            quality = state.quality()
+            changed = None
+            if state.delta:
+                # Delta-Clients vergleichen Kacheln statt des ganzen Bildes
+                gray = self._tile_gray(frame) if gray is None else gray
+                changed = self._changed_tiles(state, gray, quality)
+                # ohne Unterdrückung (idle.enabled: false) auch leere Deltas senden
+                if (self.idle is not None and changed is not None and not changed.any()
+                        and time.time() - state.last_sent < self.idle['keepalive']):
+                    state.unchanged += 1
+                    self.unchanged += 1
+                    continue
+            elif self.idle is not None:
+                thumbnail = self._thumbnail(frame) if thumbnail is None else thumbnail
+                if self._unchanged(state, thumbnail):
+                    state.unchanged += 1
+                    self.unchanged += 1
+                    continue
+            frame_id = next(self._frame_ids)
+            if not state.acquire(frame_id):
+                self.skipped += 1
+                continue
+            if not state.delta and thumbnail is not None:
+                state.reference = thumbnail
+            state.last_sent = time.time()
             
-            frame = self.cam.get_frame() 
-            if frame is not None:
-                self._alert_v.add_frame(frame)
-                video_json =  {
+            # encodings are shared by every client in the same tier
+            if state.delta:
+                video_json = self._delta_frame(frame, state, gray, quality, changed)
+                video_json['t'] = int(frame.timestamp * 1000)
+            elif state.binary:
+                # raw JPEG as binary attachment, epoch milliseconds as header
+                video_json = {
+                                't' : int(frame.timestamp * 1000),
+                                'data' : frame.jpeg(quality),
+                             }
+            else:
+                video_json = {
                                 'time' : now,
-                              }
-                
-                for client in self.clients.copy().keys():
-                    serverTime = self.clients.get(client, {}).get('serverTime', now) or now
-                    timediff = (parser.isoparse(serverTime) - datetime.datetime.fromisoformat(now)).total_seconds()
-                    quality = None
-                    for threshold, q in quality_mapping.items():
-                        if timediff <= threshold:
-                            quality = q
-                            break
-                        
-                    if quality is not None:
-                        video_json['data'] = self._compress_frame(frame=frame, quality=quality)
-                    else:
-                        video_json['data'] = None
-                        
-                    socketio.emit('frame', video_json, room=client)
-                        
-            
-            audio_data = self.cam.get_audio_data()
-            if audio_data!=[]:
-                self._alert_a.evaluate(audio_data) 
-                alert_json = {'audio' : self._alert_a.alert_level}
+                                'data' : frame.encode(quality),
+                             }
+            video_json['rtt'] = state.rtt
+
+            if state.delta:
+                mode = 'delta'
+                size = len(video_json['data']) if video_json['key'] else sum(len(t['data']) for t in video_json['tiles'])
             else:
-                alert_json = {'audio' : 0 }
-                
-            alert_json.update({
-                'alert' : self._alert.status(),
-                'video' : self._alert_v.alert_level,
-            })
-
-            socketio.emit('alert', alert_json)       
+                mode = 'binary' if state.binary else 'base64'
+                size = len(video_json['data'])
+            observe_time, observe_bytes = self._emit[mode]
+            start = time.perf_counter()
+            self.socketio.emit('frame', video_json, to=client, callback=functools.partial(state.ack, frame_id))
+            observe_time(time.perf_counter() - start)
+            observe_bytes(size)
+
+    def _broadcast_alert(self):
+        alert_json = {
+            'audio' : self._alert_a.alert_level,
+            'alert' : self._alert.status(),
+            'video' : self._alert_v.alert_level,
+        }
+        now = time.time()
+        if self.history is not None:
+            self.history.append(now, alert_json['audio'], alert_json['video'], alert_json['alert'])
+        if self.recorder is not None:
+            if alert_json['alert']:
+                self.recorder.trigger(now)
+            self.recorder.tick(now)
+        self.socketio.emit('alert', alert_json, to=self.room)
             
-    def add_client(self, sid):
-        self.clients[request.sid] = {}
-        
-    def update_client_timediff(self, client=None, data=None):
-        if client==None or data==None:
-            return
-        self.clients[client] = data
+    def metrics(self):
+        """Counters kept by the pipeline and the supervisors, read at scrape time."""
+        camera = {'camera': self.name}
+        dropped = dict(self.dropped)
+        for stage in self.stages:
+            dropped[stage.name] = dropped.get(stage.name, 0) + stage.dropped
+        for stage, count in dropped.items():
+            yield ('ipcam_frames_dropped_total', 'counter', "Values skipped by a pipeline stage that was busy.",
+                   dict(camera, stage=stage), count)
+        yield ('ipcam_frames_skipped_total', 'counter', "Frames not sent to a client without credits.",
+               camera, self.skipped)
+        yield ('ipcam_frames_unchanged_total', 'counter', "Frames not sent to a client because the scene did not change.",
+               camera, self.unchanged)
+        yield ('ipcam_audio_fanout_dropped_total', 'counter', "Audio chunks dropped for slow listeners.",
+               camera, self.cam.audio_fanout.dropped)
+        yield ('ipcam_clients', 'gauge', "Connected clients.", camera, len(self.clients))
+        for stream in (self.cam.video, self.cam.audio):
+            labels = dict(camera, stream=stream.name)
+            yield ('ipcam_reconnects_total', 'counter', "Reconnect attempts of a stream.", labels, stream.reconnects)
+            yield ('ipcam_rediscoveries_total', 'counter', "Camera searches of a stream.", labels, stream.rediscoveries)
+            yield ('ipcam_stream_live', 'gauge', "1 while the stream is live.", labels,
+                   int(stream.state == stream.LIVE))
+
+    def add_client(self, sid, binary=False, delta=False):
+        self.clients[sid] = ClientState(binary=binary or delta, delta=delta, quality_mapping=self.quality_mapping)
 
     def remove_client(self, sid):
-        if sid in self.clients.keys():
-            self.clients.pop(sid)
-        if not self.clients:
-            self.stop()
+        self.clients.pop(sid, None)
+        with self._lock:
+            # ein Reload kann schon wieder verbunden sein
+            if self.clients:
+                return
+            if self.persistent:
+                self._stop_broadcast()
+            else:
+                self._stop()
 
 
 conf = ConfigReader('data/config.yml')
-cam = CameraEntity(hostname=conf.get_hostname(),
-                   subnet=conf.get_subnet(),
-                   mac=conf.get_mac(),
-                   baseline=conf.get_baseline(),
-                   username=conf.get_auth().get('user'),
-                   password=conf.get_auth().get('pw'))
-cam.init_streams()
+
+# Worker-Prozesse werden geforkt, also bevor irgendein Thread läuft
+motion_pool = MotionProcessPool(processes=conf.get_motion_processes()) if conf.get_motion_processes() else None
 
 app = Flask(__name__)
-socketio = SocketIO(app, cors_allowed_origins="*")
+# unter gunicorn -k gevent laufen die Verbindungen als Greenlets, sonst als Threads
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=green() or 'threading')
+
+# Bewegungs- und Audioanalyse aller Kameras teilen sich einen begrenzten Pool
+analysis_pool = ThreadPoolExecutor(max_workers=conf.get_workers(), thread_name_prefix='analysis')
+
+frame_generators = dict()
+# Einstellungen je Kamera, z.B. für die Vorgaben der Seite
+camera_configs = dict()
+for cam_conf in conf.get_cameras():
+    cam = CameraEntity(name=cam_conf.get_name(),
+                       hostname=cam_conf.get_hostname(),
+                       ip=cam_conf.get_ip(),
+                       port=cam_conf.get_port(),
+                       subnet=cam_conf.get_subnet(),
+                       mac=cam_conf.get_mac(),
+                       baseline=cam_conf.get_baseline(),
+                       passthrough=cam_conf.get_passthrough(),
+                       denoise=cam_conf.get_denoise(),
+                       username=cam_conf.get_auth().get('user'),
+                       password=cam_conf.get_auth().get('pw'))
+    record = cam_conf.get_record()
+    recorder = None
+    if record.get('enabled', False) == True:
+        recorder = ClipRecorder(os.path.join(record.get('directory', 'data/clips'), cam_conf.get_name()),
+                                pre_roll=record.get('pre_roll', 10),
+                                post_roll=record.get('post_roll', 20),
+                                segment=record.get('segment', 60))
+    history_conf = cam_conf.get_history()
+    history = None
+    if history_conf.get('enabled', True) == True:
+        history = TimeSeriesStore(os.path.join(history_conf.get('directory', 'data/history'), cam_conf.get_name()),
+                                  retention_days=history_conf.get('retention_days', 30))
+    generator = GenerateFrames(socketio=socketio, cam=cam, quality_mapping=cam_conf.get_quality_mapping(),
+                               motion_scale=cam_conf.get_motion_scale(),
+                               motion_threshold=cam_conf.get_motion_threshold(), name=cam_conf.get_name(),
+                               executor=analysis_pool, motion_pool=motion_pool,
+                               recorder=recorder, record_quality=record.get('quality'), history=history,
+                               idle=cam_conf.get_idle(), delta=cam_conf.get_delta())
+    frame_generators[generator.name] = generator
+    camera_configs[generator.name] = cam_conf
+    REGISTRY.add_collector(generator.metrics)
+
+    # Kamerasuche und Streams laufen im Hintergrund, der Server lauscht sofort
+    cam.add_state_callback(lambda status, room=generator.room: socketio.emit('status', status, to=room))
+    cam.init_streams()
+    if generator.persistent:
+        generator.start()
+
+# erste Kamera für die Routen ohne Kameranamen
+default_camera = next(iter(frame_generators))
+
+
+def get_generator(camera=None):
+    generator = frame_generators.get(camera or default_camera)
+    if generator is None:
+        abort(404)
+    return generator
+
 
-frame_generator = GenerateFrames(socketio=socketio, cam=cam)
+def camera_route(rule, **options):
+    """Registers ``/api/<rule>`` for the default camera and ``/api/cameras/<camera>/<rule>``."""
+    def decorator(f):
+        app.add_url_rule(f'/api/{rule}', view_func=f, defaults={'camera': None}, **options)
+        app.add_url_rule(f'/api/cameras/<camera>/{rule}', view_func=f, **options)
+        return f
+    return decorator
 
-@app.route('/api/set_baseline', methods=['POST'])
-def set_baseline():
+@camera_route('set_baseline', methods=['POST'])
+def set_baseline(camera=None):
+    frame_generator = get_generator(camera)
     data = request.get_json()
 
-    while frame_generator.cam.a.current_level==None:
-        frame_generator.cam._init_audio_stream()
-        frame_generator.cam.a.start_monitoring()
-        
-    frame_generator.cam.record_audio_baseline()
+    if not frame_generator.cam.record_audio_baseline():
+        return jsonify({
+            'status': 'error',
+            'message': 'Kein Audiostream verfügbar',
+        }), 503
     frame_generator._alert_v._set_baseline()
         
     response = {
@@ -148,8 +449,9 @@ def set_baseline():
     }
     return jsonify(response)
 
-@app.route('/api/set_audio_threshold', methods=['POST'])
-def set_audio_threshold():
+@camera_route('set_audio_threshold', methods=['POST'])
+def set_audio_threshold(camera=None):
+    frame_generator = get_generator(camera)
     data = request.get_json()
         
     frame_generator._alert_a.set_threshold(data.get('threshold'))
@@ -160,64 +462,175 @@ def set_audio_threshold():
     }
     return jsonify(response)
 
-@app.route('/api/get_audio_threshold', methods=['GET'])
-def get_audio_threshold():
-    return jsonify({'threshold': frame_generator._alert_a._threshold})
+@camera_route('get_audio_threshold', methods=['GET'])
+def get_audio_threshold(camera=None):
+    return jsonify({'threshold': get_generator(camera)._alert_a._threshold})
 
-@app.route('/api/alert_enable', methods=['GET'])
-def api_alert_enable():
+@camera_route('alert_enable', methods=['GET'])
+def api_alert_enable(camera=None):
+    frame_generator = get_generator(camera)
     frame_generator._alert.enable()
     return jsonify({'status': frame_generator._alert.enabled})
 
-@app.route('/api/alert_disable', methods=['GET'])
-def api_alert_disable():
+@camera_route('alert_disable', methods=['GET'])
+def api_alert_disable(camera=None):
+    frame_generator = get_generator(camera)
     frame_generator._alert.disable()
     return jsonify({'status': frame_generator._alert.enabled})
 
-@app.route('/api/alert_toggle', methods=['GET'])
-def api_alert_toggle():
+@camera_route('alert_toggle', methods=['GET'])
+def api_alert_toggle(camera=None):
+    frame_generator = get_generator(camera)
     frame_generator._alert.toggle()
     return jsonify({'status': frame_generator._alert.enabled})
 
-@app.route('/api/alert_is_enabled', methods=['GET'])
-def api_alert_is_enabled():
-    return jsonify({'status': frame_generator._alert.enabled})
+@camera_route('alert_is_enabled', methods=['GET'])
+def api_alert_is_enabled(camera=None):
+    return jsonify({'status': get_generator(camera)._alert.enabled})
+
+@camera_route('status', methods=['GET'])
+def api_status(camera=None):
+    return jsonify(get_generator(camera).cam.status())
+
+@camera_route('pipeline_stats', methods=['GET'])
+def api_pipeline_stats(camera=None):
+    return jsonify(get_generator(camera).stats())
 
-@app.route('/api/server_time', methods=['GET'])
-def get_server_time():
-    server_time = datetime.datetime.now(pytz.timezone('Europe/Berlin')).isoformat()
-    return jsonify({'time': server_time})
+@camera_route('history', methods=['GET'])
+def api_history(camera=None):
+    """Alert levels of ``[start, end)`` (epoch seconds, default: last ``hours``) in ``buckets`` buckets."""
+    frame_generator = get_generator(camera)
+    if frame_generator.history is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Verlauf ist deaktiviert',
+        }), 404
+    end = request.args.get('end', time.time(), type=float)
+    start = request.args.get('start', end - 3600 * request.args.get('hours', 24, type=float), type=float)
+    buckets = min(request.args.get('buckets', 200, type=int), 5000)
+    if end <= start:
+        return jsonify({
+            'status': 'error',
+            'message': 'end muss nach start liegen',
+        }), 400
+    return jsonify(frame_generator.history.query(start, end, buckets))
 
-@app.route('/audio')
-def audio_stream():
-    def generate():
-        with frame_generator.cam.get_audio_stream() as r:
-            for chunk in r.iter_content(chunk_size=1024):
-                if chunk:
-                    yield chunk
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
-    return Response(generate(), mimetype='audio/mpeg')
+# Diagnose im laufenden Betrieb, inaktiv bis zum Aufruf
+profiler = SamplingProfiler()
+allocations = AllocationTracker()
 
-@app.route('/')
-def index():
-    return render_template('index.html')
+
+def check_admin():
+    # ohne konfiguriertes admin.token bleiben die Admin-Routen gesperrt
+    token = conf.get_admin().get('token')
+    given = request.headers.get('X-Admin-Token', request.args.get('token'))
+    if not token or not given or not hmac.compare_digest(str(given), str(token)):
+        abort(403)
+
+@app.route('/api/admin/profile', methods=['POST'])
+def admin_profile():
+    """Samples the pipeline and audio threads for ``seconds``; returns collapsed stacks for flamegraph.pl."""
+    check_admin()
+    if not profiler.supported:
+        return jsonify({
+            'status': 'error',
+            'message': 'Profiler wird unter diesem Server nicht unterstützt',
+        }), 501
+    seconds = min(request.args.get('seconds', 10, type=float), 120)
+    interval = max(request.args.get('interval', 0.005, type=float), 0.001)
+    if request.args.get('threads'):
+        prefixes = request.args.get('threads').split(',')
+    else:
+        prefixes = [f'{name}-' for name in frame_generators] + ['analysis', 'AudioMonitor']
+    stacks = profiler.profile(seconds, interval, prefixes)
+    if stacks is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Profiler läuft bereits',
+        }), 409
+    if not stacks:
+        return jsonify({
+            'status': 'error',
+            'message': f'Keine passenden Threads gefunden: {", ".join(prefixes)}',
+        }), 404
+    return Response(stacks, mimetype='text/plain',
+                    headers={'Content-Disposition': 'attachment; filename=profile.folded'})
+
+@app.route('/api/admin/tracemalloc/start', methods=['POST'])
+def admin_tracemalloc_start():
+    check_admin()
+    allocations.start(frames=request.args.get('frames', 10, type=int))
+    return jsonify({
+        'status': 'success',
+        'message': 'tracemalloc gestartet',
+    })
+
+@app.route('/api/admin/tracemalloc', methods=['GET'])
+def admin_tracemalloc_diff():
+    """Growth since ``start``, grouped by ``key`` (lineno, traceback or filename)."""
+    check_admin()
+    key = request.args.get('key', 'lineno')
+    if key not in ('lineno', 'traceback', 'filename'):
+        abort(400)
+    diff = allocations.diff(top=request.args.get('top', 20, type=int), key_type=key)
+    if diff is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'tracemalloc ist nicht gestartet',
+        }), 409
+    return jsonify(diff)
+
+@app.route('/api/admin/tracemalloc/stop', methods=['POST'])
+def admin_tracemalloc_stop():
+    check_admin()
+    allocations.stop()
+    return jsonify({
+        'status': 'success',
+        'message': 'tracemalloc gestoppt',
+    })
+
+@app.route('/api/cameras', methods=['GET'])
+def api_cameras():
+    return jsonify({name: generator.cam.status() for name, generator in frame_generators.items()})
+
+@app.route('/audio', defaults={'camera': None})
+@app.route('/audio/<camera>')
+def audio_stream(camera=None):
+    return Response(get_generator(camera).cam.listen_audio(), mimetype='audio/mpeg')
+
+@app.route('/', defaults={'camera': None})
+@app.route('/camera/<camera>')
+def index(camera=None):
+    frame_generator = get_generator(camera)
+    cam_conf = camera_configs[frame_generator.name]
+    return render_template('index.html', binary=cam_conf.get_binary_frames(),
+                           delta=cam_conf.get_delta()['default'] == True, camera=frame_generator.name)
 
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
     print('Client connected')
-    frame_generator.add_client(request.sid)
-    if not frame_generator.running.is_set():
-        frame_generator.start()
+    auth = auth or {}
+    frame_generator = frame_generators.get(auth.get('camera') or default_camera)
+    if frame_generator is None:
+        return False
+    join_room(frame_generator.room)
+    frame_generator.add_client(request.sid, binary=bool(auth.get('binary')), delta=bool(auth.get('delta')))
+    emit('status', frame_generator.cam.status())
+    frame_generator.start()
 
 @socketio.on('disconnect')
 def handle_disconnect():
     print('Client disconnected')
-    frame_generator.remove_client(request.sid)
-    
-@socketio.on('time_diff')
-def handle_time_diff(time_diff):
-    frame_generator.update_client_timediff(client=request.sid, data=time_diff)
+    for frame_generator in frame_generators.values():
+        if request.sid in frame_generator.clients:
+            frame_generator.remove_client(request.sid)
 
 if __name__ == '__main__':
-    pass
-    socketio.run(app, host='0.0.0.0', port=5000, debug=True, allow_unsafe_werkzeug=True)
\ No newline at end of file
+    # nur zur Entwicklung, produktiv über entrypoint.sh (gunicorn + gevent)
+    # PORT und RELOAD=0 z.B. für bench.py
+    socketio.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=True,
+                 use_reloader=os.environ.get('RELOAD', '1') != '0', allow_unsafe_werkzeug=True)
\ No newline at end of file
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+End-to-end benchmark against the fake camera.
+
+    python bench.py --clients 1,10,50 --duration 20 --resolution 1280x720 --fps 15
+
+Starts ``fakecam.FakeCamera``, runs ``app.py`` in a scratch directory with a
+config that points at it, and connects N headless binary Socket.IO clients
+per step. Each step reports the capture FPS of the server, received FPS and
+bandwidth per client, emit latency percentiles (frame timestamp to arrival,
+same host clock), server CPU per client and the server's memory over time.
+
+``--url`` and ``--pid`` benchmark an already running server instead;
+``--server gunicorn`` starts the production entry point, ``--delta``
+measures clients that receive changed tiles only. Install
+websocket-client, otherwise the clients fall back to long polling.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import tempfile
+import argparse
+import threading
+import subprocess
+import numpy as np
+import psutil
+import requests
+import engineio
+import socketio
+import yaml
+
+from fakecam import FakeCamera
+
+
+class _OrderedEngineIOClient(engineio.Client):
+    # jede Nachricht in einem eigenen Thread vertauscht Binäranhänge verschiedener Frames
+    def _trigger_event(self, event, *args, **kwargs):
+        if event == 'message':
+            kwargs['run_async'] = False
+        return super()._trigger_event(event, *args, **kwargs)
+
+
+class _Client(socketio.Client):
+    def _engineio_client_class(self):
+        return _OrderedEngineIOClient
+
+
+class BenchClient:
+    """One headless viewer that acknowledges every frame like the browser does."""
+    def __init__(self, url, camera=None, delta=False):
+        self.url = url
+        self.camera = camera
+        self.delta = delta
+        self.latencies = []
+        self.frames = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self.sio = _Client(reconnection=False)
+        self.sio.on('frame', self._on_frame)
+
+    def _on_frame(self, data):
+        received = time.time() * 1000
+        with self._lock:
+            self.frames += 1
+            self.bytes += len(data.get('data') or b'') + sum(len(tile['data']) for tile in data.get('tiles') or ())
+            if 't' in data:
+                self.latencies.append(received - data['t'])
+        return True
+
+    def connect(self):
+        self.sio.connect(self.url, auth={'binary': True, 'delta': self.delta, 'camera': self.camera}, wait_timeout=10)
+
+    def reset(self):
+        with self._lock:
+            self.latencies = []
+            self.frames = 0
+            self.bytes = 0
+
+    def disconnect(self):
+        try:
+            self.sio.disconnect()
+        except Exception:
+            pass
+
+
+def start_server(camera_port, server_port, workdir, mode='dev'):
+    os.makedirs(os.path.join(workdir, 'data'), exist_ok=True)
+    config = {
+        'ip': '127.0.0.1',
+        'port': camera_port,
+        'auth': {'user': 'admin', 'pw': 'admin'},
+        'baseline': 26,
+        'history': {'enabled': False},
+    }
+    with open(os.path.join(workdir, 'data', 'config.yml'), 'w') as file:
+        yaml.safe_dump(config, file)
+    directory = os.path.dirname(os.path.abspath(__file__))
+    if mode == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '--worker-class', 'gevent', '-w', '1',
+                   '--worker-connections', '1000', '-b', f'127.0.0.1:{server_port}', '--pythonpath', directory,
+                   'app:app']
+    else:
+        command = [sys.executable, os.path.join(directory, 'app.py')]
+    # ohne Reloader kein Kindprozess, der den Port nach dem Beenden weiter belegt
+    environment = dict(os.environ, PORT=str(server_port), RELOAD='0')
+    process = subprocess.Popen(command, cwd=workdir, env=environment, start_new_session=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{server_port}'
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            if requests.get(url + '/api/status', timeout=1).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError("server did not come up")
+
+
+def stop_server(process):
+    """Stops the server with everything it spawned, it runs in its own session."""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+
+def capture_count(url, camera=None):
+    path = f'/api/cameras/{camera}/pipeline_stats' if camera else '/api/pipeline_stats'
+    try:
+        return requests.get(url + path, timeout=2).json()['stages']['video_capture']['processed']
+    except Exception:
+        return None
+
+
+def process_tree(process):
+    # mit debug=True läuft die App in einem Kindprozess des Reloaders
+    try:
+        return [process] + process.children(recursive=True)
+    except psutil.Error:
+        return [process]
+
+
+def cpu_seconds(process):
+    total = 0.0
+    for p in process_tree(process):
+        try:
+            times = p.cpu_times()
+            total += times.user + times.system
+        except psutil.Error:
+            pass
+    return total
+
+
+def rss_mb(process):
+    total = 0
+    for p in process_tree(process):
+        try:
+            total += p.memory_info().rss
+        except psutil.Error:
+            pass
+    return round(total / 2**20, 1)
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 1) if len(values) else None
+
+
+def run_step(url, n, duration, warmup, process, camera=None, delta=False):
+    clients = [BenchClient(url, camera, delta) for _ in range(n)]
+    for client in clients:
+        client.connect()
+    time.sleep(warmup)
+    for client in clients:
+        client.reset()
+
+    memory = []
+    cpu_start = cpu_seconds(process) if process is not None else None
+    captured = capture_count(url, camera)
+    start = time.time()
+    while time.time() - start < duration:
+        time.sleep(1)
+        if process is not None:
+            memory.append((round(time.time() - start, 1), rss_mb(process)))
+    elapsed = time.time() - start
+    cpu = round(100 * (cpu_seconds(process) - cpu_start) / elapsed, 1) if process is not None else None
+    captured_end = capture_count(url, camera)
+
+    latencies = [latency for client in clients for latency in client.latencies]
+    result = {
+        'clients': n,
+        'capture_fps': round((captured_end - captured) / elapsed, 1) if None not in (captured, captured_end) else None,
+        'recv_fps': round(sum(c.frames for c in clients) / elapsed / n, 1),
+        'kbit_s': round(sum(c.bytes for c in clients) * 8 / 1000 / elapsed / n, 1),
+        'latency_p50_ms': percentile(latencies, 50),
+        'latency_p95_ms': percentile(latencies, 95),
+        'latency_p99_ms': percentile(latencies, 99),
+        'cpu_percent': cpu,
+        'cpu_per_client': round(cpu / n, 2) if cpu is not None else None,
+        'rss_mb': memory[-1][1] if memory else None,
+        'memory': memory,
+    }
+    for client in clients:
+        client.disconnect()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', default='1,5,20', help="client counts, one step each")
+    parser.add_argument('--duration', type=float, default=15, help="seconds measured per step")
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--resolution', default='640x480')
+    parser.add_argument('--fps', type=float, default=10)
+    parser.add_argument('--static', action='store_true', help="fake camera without motion")
+    parser.add_argument('--delta', action='store_true', help="clients request tile based delta frames")
+    parser.add_argument('--port', type=int, default=5000, help="port the started server listens on")
+    parser.add_argument('--server', choices=('dev', 'gunicorn'), default='dev',
+                        help="python app.py or the production entry point")
+    parser.add_argument('--url', help="benchmark a running server instead of starting one")
+    parser.add_argument('--pid', type=int, help="process of the running server, for CPU and memory")
+    parser.add_argument('--camera', help="camera name for multi camera servers")
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+
+    camera, server, workdir = None, None, None
+    try:
+        if args.url:
+            url = args.url
+            process = psutil.Process(args.pid) if args.pid else None
+        else:
+            camera = FakeCamera(port=0, fps=args.fps, motion=not args.static,
+                                resolution=tuple(int(v) for v in args.resolution.split('x')))
+            camera_port = camera.start()
+            workdir = tempfile.mkdtemp(prefix='ipcam-bench-')
+            server, url = start_server(camera_port, args.port, workdir, args.server)
+            process = psutil.Process(server.pid)
+
+        results = []
+        for n in [int(v) for v in args.clients.split(',')]:
+            result = run_step(url, n, args.duration, args.warmup, process, args.camera, args.delta)
+            results.append(result)
+            if not args.json:
+                print(f"{n:4d} clients: capture {result['capture_fps']} fps, "
+                      f"recv {result['recv_fps']} fps/client, {result['kbit_s']} kbit/s/client, "
+                      f"latency p50/p95/p99 {result['latency_p50_ms']}/{result['latency_p95_ms']}/"
+                      f"{result['latency_p99_ms']} ms, cpu {result['cpu_percent']}% "
+                      f"({result['cpu_per_client']}%/client), rss {result['rss_mb']} MB")
+        if args.json:
+            json.dump(results, sys.stdout, indent=2)
+            print()
+    finally:
+        if server is not None:
+            stop_server(server)
+        if camera is not None:
+            camera.stop()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class StreamingDenoiser:
+    """
+    Stationary spectral gate for a continuous audio stream.
+
+    The stream is cut into 50% overlapping Hann windowed blocks, which are
+    transformed, gated and overlap-added in one vectorized batch per chunk.
+    State (input tail, overlap tail, noise profile) is kept across chunks,
+    so the output is continuous and delayed by ``n_fft // 2`` samples.
+
+    Without a learned profile the first ``learn_blocks`` blocks (about 2 s at
+    8 kHz) pass unchanged and are then learned as the profile. Gated bins keep
+    ``1 - prop_decrease`` of their amplitude, so no chunk is silenced entirely.
+    """
+    def __init__(self, **kwargs):
+        self.n_fft = kwargs.get('n_fft', 256)
+        self.hop = self.n_fft // 2
+        self.n_std_thresh = kwargs.get('n_std_thresh', 1.5)
+        self.prop_decrease = kwargs.get('prop_decrease', 0.9)
+        self.learn_blocks = kwargs.get('learn_blocks', 125)
+        # periodisches Hann-Fenster: bei 50% Überlappung summiert es sich zu 1
+        self.window = np.hanning(self.n_fft + 1)[:-1].astype(np.float32)
+        self.threshold = None
+        self._learning = []
+        self.reset()
+
+    def reset(self):
+        self._input = np.zeros(self.n_fft - self.hop, dtype=np.float32)
+        self._overlap = np.zeros(self.hop, dtype=np.float32)
+
+    def _spectrum(self, samples):
+        blocks = sliding_window_view(samples, self.n_fft)[::self.hop]
+        return np.fft.rfft(blocks * self.window, axis=1)
+
+    def _magnitude_db(self, spectrum):
+        return 20 * np.log10(np.abs(spectrum) + 1e-6)
+
+    def _learn_db(self, mag_db):
+        self.threshold = mag_db.mean(axis=0) + self.n_std_thresh * mag_db.std(axis=0)
+        self._learning = []
+
+    def learn(self, samples):
+        """Learns the noise profile (per-bin mean and deviation in dB) from noise-only samples."""
+        samples = np.asarray(samples, dtype=np.float32)
+        if len(samples) < self.n_fft:
+            return
+        self._learn_db(self._magnitude_db(self._spectrum(samples)))
+
+    def relearn(self):
+        """Forgets the profile; the next ``learn_blocks`` blocks of the stream are learned instead."""
+        self.threshold = None
+        self._learning = []
+
+    def process(self, chunk):
+        """Denoises one chunk and returns the same number of samples in the input dtype."""
+        chunk = np.asarray(chunk)
+        samples = np.concatenate((self._input, chunk.astype(np.float32)))
+        n_blocks = (len(samples) - self.n_fft) // self.hop + 1
+        if n_blocks <= 0:
+            self._input = samples
+            return np.zeros(0, dtype=chunk.dtype)
+
+        spectrum = self._spectrum(samples)[:n_blocks]
+        mag_db = self._magnitude_db(spectrum)
+        if self.threshold is None:
+            # ohne Baseline-Aufnahme das Profil über mehrere Chunks schätzen, bis dahin ungefiltert
+            self._learning.append(mag_db)
+            if sum(len(m) for m in self._learning) >= self.learn_blocks:
+                self._learn_db(np.concatenate(self._learning))
+            gain = np.float32(1.0)
+        else:
+            gain = np.where(mag_db > self.threshold, 1.0, 1.0 - self.prop_decrease).astype(np.float32)
+        blocks = np.fft.irfft(spectrum * gain, n=self.n_fft, axis=1).astype(np.float32)
+
+        # Overlap-Add: erste Hälfte jedes Blocks plus zweite Hälfte des vorherigen
+        out = blocks[:, :self.hop].copy()
+        out[0] += self._overlap
+        out[1:] += blocks[:-1, self.hop:]
+        self._overlap = blocks[-1, self.hop:].copy()
+        self._input = samples[n_blocks * self.hop:]
+
+        out = out.ravel()
+        if np.issubdtype(chunk.dtype, np.integer):
+            info = np.iinfo(chunk.dtype)
+            out = np.clip(np.round(out), info.min, info.max)
+        return out.astype(chunk.dtype)
@@ -1,3 +1,8 @@
 #!/bin/sh
-# gunicorn --worker-class eventlet -w 1 -b 0.0.0.0:5000 app:app
-python app.py
\ No newline at end of file
+# SERVER=dev startet den Flask-Entwicklungsserver mit Reloader
+if [ "$SERVER" = "dev" ]; then
+    exec python app.py
+fi
+# ein Worker: Clients, Pipelines und Alarme leben im Prozess; Verbindungen als Greenlets,
+# OpenCV und andere blockierende Aufrufe laufen über den Threadpool von gevent in echten Threads
+exec gunicorn --worker-class gevent -w 1 --worker-connections 1000 -b 0.0.0.0:5000 app:app
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Synthetic stand-in for the IP camera.
+
+    python fakecam.py --port 8081 --resolution 1280x720 --fps 15
+
+Serves ``video.cgi`` (multipart MJPEG), ``audio.cgi`` (raw 16 bit PCM at
+8 kHz), ``image/jpeg.cgi`` and ``common/info.cgi`` behind basic auth, like
+the real camera. Point the server at it with a fixed address in the config,
+which skips the network search::
+
+    ip: 127.0.0.1
+    port: 8081
+    auth:
+      user: admin
+      pw: admin
+
+Frames and audio are rendered once at startup and looped, so the stand-in
+itself costs next to no CPU during a benchmark.
+"""
+import time
+import base64
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+import cv2
+
+
+BOUNDARY = b'video boundary--'
+
+
+def render_frames(width=640, height=480, fps=10, seconds=4, motion=True, quality=80):
+    """JPEG frames of a noisy static scene with a moving box, ``seconds`` long."""
+    rng = np.random.default_rng(0)
+    background = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (0, 0), 3)
+    frames = []
+    count = max(1, int(fps * seconds))
+    size = max(8, min(width, height) // 6)
+    for i in range(count):
+        image = background.copy()
+        if motion:
+            x = int((width - size) * i / count)
+            cv2.rectangle(image, (x, height // 3), (x + size, height // 3 + size), (255, 255, 255), -1)
+        cv2.putText(image, f'{i:04d}', (10, height - 10), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+        frames.append(cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), quality])[1].tobytes())
+    return frames
+
+
+def render_audio(sample_rate=8000, seconds=1, level=200, tone=440):
+    """One ``seconds`` long loop of 16 bit PCM: noise plus a quiet tone."""
+    rng = np.random.default_rng(0)
+    t = np.arange(sample_rate * seconds) / sample_rate
+    samples = rng.normal(0, level, len(t)) + level * np.sin(2 * np.pi * tone * t)
+    return np.clip(samples, -32768, 32767).astype('<i2').tobytes()
+
+
+class FakeCamera:
+    def __init__(self, **kwargs):
+        self.host = kwargs.get('host', '127.0.0.1')
+        self.port = kwargs.get('port', 8081)
+        self.fps = kwargs.get('fps', 10)
+        self.sample_rate = kwargs.get('sample_rate', 8000)
+        self.username = kwargs.get('username', 'admin')
+        self.password = kwargs.get('password', 'admin')
+        width, height = kwargs.get('resolution', (640, 480))
+        self.frames = render_frames(width, height, self.fps, motion=kwargs.get('motion', True))
+        self.audio = render_audio(self.sample_rate)
+        self.server = None
+        self.thread = None
+
+    def authorized(self, header):
+        if not self.username:
+            return True
+        token = base64.b64encode(f'{self.username}:{self.password}'.encode()).decode()
+        return header == f'Basic {token}'
+
+    def start(self):
+        """Serves in a background thread; returns the bound port."""
+        self.server = ThreadingHTTPServer((self.host, self.port), _handler(self))
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fakecam', daemon=True)
+        self.thread.start()
+        return self.port
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+def _handler(camera):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if not camera.authorized(self.headers.get('Authorization')):
+                self.send_response(401)
+                self.send_header('WWW-Authenticate', 'Basic realm="camera"')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            path = self.path.split('?')[0]
+            try:
+                if path == '/video.cgi':
+                    self._video()
+                elif path == '/audio.cgi':
+                    self._audio()
+                elif path == '/image/jpeg.cgi':
+                    self._send(200, 'image/jpeg', camera.frames[int(time.time() * camera.fps) % len(camera.frames)])
+                elif path == '/common/info.cgi':
+                    self._send(200, 'text/plain', b'name=fakecam\n')
+                else:
+                    self._send(404, 'text/plain', b'not found\n')
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def _send(self, status, content_type, body):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _video(self):
+            self.send_response(200)
+            self.send_header('Content-Type', f'multipart/x-mixed-replace;boundary={BOUNDARY.decode()}')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            interval = 1 / camera.fps
+            next_frame = time.monotonic()
+            index = 0
+            while True:
+                jpeg = camera.frames[index % len(camera.frames)]
+                self.wfile.write(b'--' + BOUNDARY + b'\r\nContent-Type: image/jpeg\r\n'
+                                 + f'Content-Length: {len(jpeg)}\r\n\r\n'.encode() + jpeg + b'\r\n')
+                index += 1
+                next_frame += interval
+                time.sleep(max(0, next_frame - time.monotonic()))
+
+        def _audio(self):
+            self.send_response(200)
+            self.send_header('Content-Type', f'audio/L16;rate={camera.sample_rate};channels=1')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            # in Häppchen von 0.1 s, in Echtzeit
+            chunk = camera.sample_rate // 10 * 2
+            next_chunk = time.monotonic()
+            position = 0
+            while True:
+                data = camera.audio[position:position + chunk]
+                if len(data) < chunk:
+                    data += camera.audio[:chunk - len(data)]
+                position = (position + chunk) % len(camera.audio)
+                self.wfile.write(data)
+                next_chunk += 0.1
+                time.sleep(max(0, next_chunk - time.monotonic()))
+
+    return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Synthetic IP camera for local testing and benchmarks")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--resolution', default='640x480')
+    parser.add_argument('--fps', type=float, default=10)
+    parser.add_argument('--user', default='admin')
+    parser.add_argument('--pw', default='admin')
+    parser.add_argument('--static', action='store_true', help="no moving box")
+    args = parser.parse_args()
+
+    camera = FakeCamera(host=args.host, port=args.port, fps=args.fps, username=args.user, password=args.pw,
+                        resolution=tuple(int(v) for v in args.resolution.split('x')), motion=not args.static)
+    print(f"Fake camera on http://{args.host}:{camera.start()}/video.cgi")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        camera.stop()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+import threading
+import datetime
+import base64
+import time
+import pytz
+import numpy as np
+import cv2
+
+from metrics import ENCODE
+from pipeline import offload
+
+
+def scale_frame(frame, quality=100):
+    """Downscales a BGR frame by sqrt(quality/100) below full quality, like the JPEG tiers."""
+    if quality == 100:
+        return frame
+    scale_factor = np.sqrt(quality / 100)
+    new_width = int(frame.shape[1] * scale_factor)
+    new_height = int(frame.shape[0] * scale_factor)
+    return cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_AREA)
+
+
+def encode_jpeg(frame, quality=100):
+    if quality!=100:
+        encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+        _, buffer = cv2.imencode('.jpg', frame, encode_param)
+    else:
+        _, buffer = cv2.imencode('.jpg', frame)
+    return buffer.tobytes()
+
+
+def compress_frame(frame, quality=100):
+    """Encodes a BGR frame as JPEG bytes, downscaled by sqrt(quality/100) below full quality."""
+    return encode_jpeg(scale_frame(frame, quality), quality)
+
+
+def tile_grid(size, parts):
+    """Boundaries of ``parts`` tiles along an axis of ``size`` pixels, proportional at every resolution."""
+    return np.linspace(0, size, parts + 1).astype(int)
+
+
+# IMREAD flags that decode a JPEG directly at 1/scale resolution in grayscale
+REDUCED_GRAYSCALE = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def downscale_gray(frame, scale=1):
+    """Converts a BGR frame to grayscale at 1/scale resolution."""
+    gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    if scale == 1:
+        return gray_frame
+    new_size = (max(1, frame.shape[1] // scale), max(1, frame.shape[0] // scale))
+    return cv2.resize(gray_frame, new_size, interpolation=cv2.INTER_AREA)
+
+
+class Frame:
+    """
+    A captured frame together with its encoded renditions, one per quality tier.
+
+    A frame is created either from a decoded BGR ``image`` or from the camera's
+    original ``jpeg`` bytes (passthrough). In the latter case the full quality
+    tier is the original JPEG and the image is only decoded on first access.
+    ``source`` keeps those original bytes, None for frames built from an image.
+    """
+    def __init__(self, image=None, timestamp=None, jpeg=None):
+        self._image = image
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self._tiers = dict()
+        self._tiers_b64 = dict()
+        self._gray = dict()
+        self._scaled = dict()
+        self._tiles = dict()
+        self._lock = threading.Lock()
+        self.source = jpeg
+        if jpeg is not None:
+            self._tiers[100] = jpeg
+
+    @property
+    def image(self):
+        if self._image is None:
+            with self._lock:
+                if self._image is None:
+                    self._image = offload(cv2.imdecode, np.frombuffer(self._tiers[100], dtype=np.uint8),
+                                          cv2.IMREAD_COLOR)
+        return self._image
+
+    @property
+    def time(self):
+        return datetime.datetime.fromtimestamp(self.timestamp, pytz.timezone('Europe/Berlin')).isoformat()
+
+    def gray(self, scale=1):
+        """
+        Returns a cached grayscale version at 1/scale resolution. Passthrough
+        frames that were not decoded yet are decoded straight to the reduced
+        size, which costs a fraction of a full colour decode.
+        """
+        gray = self._gray.get(scale)
+        if gray is not None:
+            return gray
+        if self._image is None and scale in REDUCED_GRAYSCALE:
+            gray = offload(cv2.imdecode, np.frombuffer(self._tiers[100], dtype=np.uint8), REDUCED_GRAYSCALE[scale])
+        else:
+            gray = offload(downscale_gray, self.image, scale)
+        self._gray[scale] = gray
+        return gray
+
+    def jpeg(self, quality=100):
+        """Returns the JPEG bytes for ``quality``; each tier is encoded at most once."""
+        encoded = self._tiers.get(quality)
+        if encoded is not None:
+            return encoded
+        image = self.image
+        with self._lock:
+            if quality not in self._tiers:
+                start = time.perf_counter()
+                self._tiers[quality] = offload(compress_frame, image, quality)
+                ENCODE.labels(quality).observe(time.perf_counter() - start)
+            return self._tiers[quality]
+
+    def encode(self, quality=100):
+        """Returns the base64 encoded JPEG for ``quality``, for clients without binary transport."""
+        encoded = self._tiers_b64.get(quality)
+        if encoded is not None:
+            return encoded
+        encoded = base64.b64encode(self.jpeg(quality)).decode('utf-8')
+        self._tiers_b64[quality] = encoded
+        return encoded
+
+    def scaled(self, quality=100):
+        """Returns the BGR image at the resolution of the ``quality`` tier."""
+        scaled = self._scaled.get(quality)
+        if scaled is None:
+            scaled = offload(scale_frame, self.image, quality)
+            self._scaled[quality] = scaled
+        return scaled
+
+    def tile(self, quality, cols, rows, col, row):
+        """
+        Returns ``(x, y, jpeg)`` of one tile of a ``cols`` x ``rows`` grid over
+        the ``quality`` tier, in the tier's pixel coordinates. Tiles are shared
+        by every delta client in the same tier like the full renditions.
+        """
+        key = (quality, cols, rows, col, row)
+        tile = self._tiles.get(key)
+        if tile is not None:
+            return tile
+        image = self.scaled(quality)
+        ys = tile_grid(image.shape[0], rows)
+        xs = tile_grid(image.shape[1], cols)
+        start = time.perf_counter()
+        jpeg = offload(encode_jpeg, image[ys[row]:ys[row + 1], xs[col]:xs[col + 1]], quality)
+        ENCODE.labels('tile').observe(time.perf_counter() - start)
+        tile = (int(xs[col]), int(ys[row]), jpeg)
+        self._tiles[key] = tile
+        return tile
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Minimal Prometheus-style instrumentation for the hot paths.
+
+Recording is a dict lookup, a bisect and two additions under a lock, so it
+stays on in production. Values that are already counted elsewhere (pipeline
+stage drops, supervisor reconnects) are read by collectors at scrape time
+instead of being counted twice.
+"""
+import bisect
+import threading
+
+
+# Sekunden, von Frame-Lesen (ms) bis Wiedersuche (s)
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTE_BUCKETS = (1000, 4000, 16000, 32000, 64000, 128000, 256000, 512000, 1000000)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._children = dict()
+        self._lock = threading.Lock()
+
+    def labels(self, *values, **kwargs):
+        key = tuple(str(v) for v in values) or tuple(str(kwargs[name]) for name in self.label_names)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key, child in sorted(self._children.copy().items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+
+class _CounterValue:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_child(self, key, child):
+        return [f'{self.name}{_format_labels(self.label_names, key)} {_format_value(child.value)}']
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=TIME_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _render_child(self, key, child):
+        with child._lock:
+            counts, total, count = list(child.counts), child.sum, child.count
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            cumulative += n
+            labels = _format_labels(self.label_names, key, ('le', _format_value(float(bound))))
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.label_names, key)
+        lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = dict()
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=TIME_BUCKETS):
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def add_collector(self, collector):
+        """``collector()`` yields ``(name, kind, documentation, labels dict, value)`` at scrape time."""
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+
+        collected = dict()
+        for collector in self._collectors:
+            try:
+                for name, kind, documentation, labels, value in collector():
+                    collected.setdefault((name, kind, documentation), []).append((labels, value))
+            except Exception as e:
+                print(f"Error in metrics collector: {e}")
+        for (name, kind, documentation), samples in collected.items():
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Erfassung
+FRAME_READ = REGISTRY.histogram('ipcam_frame_read_seconds', "Time to read one frame from the camera.", ('camera',))
+AUDIO_READ = REGISTRY.histogram('ipcam_audio_read_seconds', "Time to read one audio chunk from the camera.", ('camera',))
+# Analyse und Versand
+ENCODE = REGISTRY.histogram('ipcam_encode_seconds', "JPEG encode time per quality tier.", ('quality',))
+STAGE = REGISTRY.histogram('ipcam_stage_seconds', "Duration of one pipeline step (motion = VideoAlert.add_frame, "
+                           "audio_alert = AudioAlert.evaluate).", ('camera', 'stage'))
+EMIT = REGISTRY.histogram('ipcam_emit_seconds', "Time to emit one frame to one client.", ('camera', 'mode'))
+EMIT_BYTES = REGISTRY.histogram('ipcam_emit_bytes', "Payload size of one frame emitted to one client.",
+                                ('camera', 'mode'), buckets=BYTE_BUCKETS)
+# Verbindungen
+CONNECT = REGISTRY.histogram('ipcam_connect_seconds', "Duration of a stream connect attempt.",
+                             ('camera', 'stream', 'result'))
+REDISCOVER = REGISTRY.histogram('ipcam_rediscover_seconds', "Duration of a camera rediscovery.", ('camera', 'stream'))
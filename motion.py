@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Motion analysis in worker processes with a shared memory frame handoff.
+"""
+import multiprocessing
+import threading
+import cv2
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+from alerts import blur_gray, frame_diff_ratio
+from frames import REDUCED_GRAYSCALE, downscale_gray
+from pipeline import offload
+
+
+def _attach(name, segments):
+    shm = segments.get(name)
+    if shm is None:
+        shm = shared_memory.SharedMemory(name=name)
+        # das Segment gehört dem Hauptprozess, der es auch wieder freigibt
+        try:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+        segments[name] = shm
+    return shm
+
+
+def _preprocess(job, segments):
+    """Decodes the frame of a job to blurred grayscale at analysis resolution."""
+    _, _, _, jpeg, name, slot, shape, _, scale = job
+    if jpeg is not None:
+        buffer = np.frombuffer(jpeg, dtype=np.uint8)
+        if scale in REDUCED_GRAYSCALE:
+            gray = cv2.imdecode(buffer, REDUCED_GRAYSCALE[scale])
+        else:
+            gray = downscale_gray(cv2.imdecode(buffer, cv2.IMREAD_COLOR), scale)
+    else:
+        shm = _attach(name, segments)
+        frames = np.ndarray((len(shm.buf) // int(np.prod(shape)),) + tuple(shape), dtype=np.uint8, buffer=shm.buf)
+        gray = downscale_gray(frames[slot], scale)
+    if gray is None:
+        raise ValueError('frame could not be decoded')
+    return blur_gray(gray, scale)
+
+
+def _worker(jobs, results):
+    segments = dict()
+    # letzter vorverarbeiteter Frame je Kamera, alle Frames einer Kamera landen in diesem Worker
+    last_frames = dict()
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        key, job_id, timestamp = job[:3]
+        diff_threshold = job[7]
+        try:
+            blurred = _preprocess(job, segments)
+        except Exception as e:
+            print(f"Error in motion worker: {e}")
+            blurred = None
+        diff_ratio = None
+        last_frame = last_frames.get(key)
+        if blurred is not None:
+            if last_frame is not None and last_frame.shape == blurred.shape:
+                diff_ratio = frame_diff_ratio(last_frame, blurred, diff_threshold)
+            last_frames[key] = blurred
+        results.put((key, job_id, timestamp, diff_ratio))
+    for shm in segments.values():
+        shm.close()
+
+
+class _FrameRing:
+    """Shared memory slots for the full resolution frames of one camera; a slot is free once its job returned."""
+    def __init__(self, shape, slots):
+        self.shape = shape
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * int(np.prod(shape)))
+        self.frames = np.ndarray((slots,) + tuple(shape), dtype=np.uint8, buffer=self.shm.buf)
+        self.busy = [False] * slots
+
+    def free_slot(self):
+        for slot, busy in enumerate(self.busy):
+            if not busy:
+                return slot
+        return None
+
+    def close(self):
+        self.frames = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+class MotionProcessPool:
+    """
+    Computes frame diff ratios in worker processes.
+
+    Each camera is assigned to one worker, which decodes its frames to
+    grayscale at analysis resolution, blurs them and diffs them against the
+    previous frame it kept for that camera. Passthrough frames travel as the
+    camera's JPEG bytes, decoded frames through per-camera shared memory ring
+    slots, so the main process only copies the frame. Only
+    ``(timestamp, diff_ratio)`` comes back and is handed to the callback that
+    was registered for the camera; one worker per camera keeps the results in
+    submission order. When ``slots`` jobs of a camera are still pending the
+    frame is dropped, so analysis never queues up behind the capture.
+
+    The workers are forked, so the pool has to be created before the capture
+    and server threads are started.
+    """
+    def __init__(self, processes=2, slots=8):
+        self.processes = processes
+        self.slots = slots
+        self.submitted = 0
+        self.dropped = 0
+        self.completed = 0
+        self._callbacks = dict()
+        self._rings = dict()
+        self._pending = dict()
+        self._inflight = dict()
+        self._job_id = 0
+        self._lock = threading.Lock()
+
+        context = multiprocessing.get_context('fork')
+        self._jobs = [context.Queue() for _ in range(processes)]
+        self._results = context.Queue()
+        self._workers = [context.Process(target=_worker, args=(jobs, self._results), daemon=True, name=f'motion-{i}')
+                         for i, jobs in enumerate(self._jobs)]
+        for worker in self._workers:
+            worker.start()
+
+        self._collector = threading.Thread(target=self._collect, name='motion-results', daemon=True)
+        self._collector.start()
+
+    def register(self, key, callback, diff_threshold=3, scale=4):
+        """``callback(timestamp, diff_ratio)`` receives the results of camera ``key``."""
+        # Kameras reihum auf die Worker verteilen
+        worker = self._callbacks[key][3] if key in self._callbacks else len(self._callbacks) % self.processes
+        self._callbacks[key] = (callback, diff_threshold, scale, worker)
+
+    def submit(self, key, timestamp, jpeg=None, image=None):
+        """
+        Queues the frame of ``key`` given as ``jpeg`` bytes or as BGR ``image``
+        for analysis; returns False if it was dropped.
+        """
+        _, diff_threshold, scale, worker = self._callbacks[key]
+        with self._lock:
+            if self._inflight.get(key, 0) >= self.slots:
+                self.dropped += 1
+                return False
+            ring = slot = None
+            if jpeg is None:
+                ring = self._rings.get(key)
+                if ring is None or ring.shape != image.shape:
+                    if ring is not None and not any(ring.busy):
+                        ring.close()
+                    ring = _FrameRing(image.shape, self.slots)
+                    self._rings[key] = ring
+                slot = ring.free_slot()
+                if slot is None:
+                    self.dropped += 1
+                    return False
+                ring.busy[slot] = True
+            self._job_id += 1
+            job_id = self._job_id
+            self._inflight[key] = self._inflight.get(key, 0) + 1
+            self._pending[job_id] = (key, ring, slot)
+            self.submitted += 1
+        if ring is not None:
+            ring.frames[slot] = image
+        self._jobs[worker].put((key, job_id, timestamp, jpeg, ring.shm.name if ring else None, slot,
+                                image.shape if ring else None, diff_threshold, scale))
+        return True
+
+    def _collect(self):
+        while True:
+            try:
+                # blockiert auf einer Pipe, unter gevent also in einem echten Thread
+                result = offload(self._results.get)
+            except (EOFError, OSError):
+                break
+            if result is None:
+                break
+            key, job_id, timestamp, diff_ratio = result
+            with self._lock:
+                _, ring, slot = self._pending.pop(job_id)
+                self._inflight[key] -= 1
+                self.completed += 1
+                if ring is not None:
+                    ring.busy[slot] = False
+                    # nach einer Auflösungsänderung ersetzter Ring
+                    if ring.frames is not None and not any(ring.busy) and ring not in self._rings.values():
+                        ring.close()
+            if key not in self._callbacks or diff_ratio is None:
+                continue
+            try:
+                self._callbacks[key][0](timestamp, diff_ratio)
+            except Exception as e:
+                print(f"Error handling motion result of {key}: {e}")
+
+    def stats(self):
+        return {
+            'processes': self.processes,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'dropped': self.dropped,
+            'pending': len(self._pending),
+        }
+
+    def close(self):
+        for jobs in self._jobs:
+            jobs.put(None)
+        for worker in self._workers:
+            worker.join(timeout=2)
+        self._results.put(None)
+        with self._lock:
+            for ring in self._rings.values():
+                ring.close()
+            self._rings.clear()
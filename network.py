@@ -2,31 +2,121 @@
 # -*- coding: utf-8 -*-
 import nmap
 import socket
-import ipaddress
 import psutil
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def lookup_neighbor(mac, path='/proc/net/arp'):
+    """Returns the IPv4 address the kernel neighbor table holds for ``mac``, or None."""
+    if not mac:
+        return None
+    mac = mac.lower()
+    try:
+        with open(path, 'r') as file:
+            next(file, None)  # Kopfzeile
+            for line in file:
+                fields = line.split()
+                # IP address, HW type, Flags, HW address, Mask, Device; Flags 0x0 = unvollständig
+                if len(fields) >= 4 and fields[3].lower() == mac and fields[2] != '0x0':
+                    return fields[0]
+    except OSError:
+        pass
+    return None
+
+
+def probe_port(ip, port=80, timeout=0.5):
+    """Checks whether a TCP connection to ``ip``:``port`` can be opened."""
+    if not ip:
+        return False
+    try:
+        with socket.create_connection((ip, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
 
 class NetworkDevice:
     def __init__(self, **kwargs):
         self.hostname = kwargs.get('hostname')
         self.subnet = kwargs.get('subnet')
         self.mac = kwargs.get('mac')
+        self.port = kwargs.get('port', 80)
+        self.ttl = kwargs.get('ttl', 5)  # so lange gilt die letzte gute IP ohne erneute Prüfung
         
         self.status = None
-        self._scan_for_ip()
+        self.ip = kwargs.get('ip')
+        self._verified_at = None
+        # gleichzeitige Anfragen (Video und Audio) teilen sich eine Suche
+        self._lock = threading.Lock()
+
+    def _remember(self, ip):
+        self.ip = ip
+        self._verified_at = time.monotonic()
+        return ip
         
     def _scan_for_ip(self):
-        self.ip = DeviceScanner().find_host(self.hostname, scan = self.subnet, mac=self.mac)
+        self.ip = DeviceScanner.shared().find_host(self.hostname, scan = self.subnet, mac=self.mac)
+
+    def _resolve_fast(self):
+        """Cached IP, then the camera's HTTP port, then the kernel neighbor table."""
+        if self.ip and self._verified_at is not None and time.monotonic() - self._verified_at < self.ttl:
+            return self.ip
+        if probe_port(self.ip, self.port):
+            return self._remember(self.ip)
+        ip = lookup_neighbor(self.mac)
+        if ip and probe_port(ip, self.port):
+            print(f"Found {self.mac} in neighbor table at {ip}")
+            return self._remember(ip)
+        return None
         
-    def get_ip(self):
-        while DeviceScanner().check_if_is_online(self.ip)==False:
+    def get_ip(self, retry=True):
+        """Resolves the device IP; with ``retry=False`` a single round is made and None returned on failure."""
+        with self._lock:
+            return self._get_ip(retry)
+
+    def _get_ip(self, retry):
+        while True:
+            ip = self._resolve_fast()
+            if ip:
+                return ip
+            # nmap nur als letzte Möglichkeit
+            if self.ip and DeviceScanner.shared().check_if_is_online(self.ip):
+                return self._remember(self.ip)
+            last_ip = self.ip
             self._scan_for_ip()
-            
-        return self.ip
+            if self.ip:
+                return self._remember(self.ip)
+            if not retry:
+                self.ip = last_ip
+                return None
+            time.sleep(1)
 
 
 class DeviceScanner:
+    _shared = None
+    _shared_lock = threading.Lock()
+
     def __init__(self):
         self.scanner = nmap.PortScanner()
+        # PortScanner hält das letzte Ergebnis im Objekt, daher nur ein Scan gleichzeitig
+        self._lock = threading.Lock()
+        self._subnet_scanners = dict()
+
+    @classmethod
+    def shared(cls):
+        """Process wide scanner, so nmap is not probed again for every lookup."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def _subnet_scanner(self, subnet):
+        with self._lock:
+            if subnet not in self._subnet_scanners:
+                self._subnet_scanners[subnet] = nmap.PortScanner()
+            return self._subnet_scanners[subnet]
 
     def _get_local_interfaces(self):
         ip_addresses = []
@@ -54,18 +144,40 @@ class DeviceScanner:
 
         try:
             interfaces.extend([(k[0], '.'.join(k[1].split('.')[:-1]) + '.0/24') for k in self._get_local_interfaces()])
-            for interface, subnet in interfaces:
-                print(f"Scanning the local network for the host: {hostname} on subnet {subnet}...")
-                self.scanner.scan(hosts=subnet, arguments='-sn')
-                for ip in self.scanner.all_hosts():
-                    print(f'Scanning {self._clean_hostname(self.scanner[ip].hostname())} / {ip}')
-                    if self.scanner[ip]['addresses'].get('mac', 'N/A') == mac:
-                        return ip
-                    elif self._clean_hostname(self.scanner[ip].hostname()) == hostname:
+            subnets = list(dict.fromkeys(subnet for _, subnet in interfaces))
+            if not subnets:
+                return None
+            # alle Subnetze gleichzeitig, das erste Ergebnis gewinnt
+            executor = ThreadPoolExecutor(max_workers=len(subnets))
+            try:
+                futures = [executor.submit(self._scan_subnet, subnet, hostname, mac) for subnet in subnets]
+                for future in as_completed(futures):
+                    ip = future.result()
+                    if ip is not None:
                         return ip
+            finally:
+                # nicht auf die langsameren Scans warten
+                executor.shutdown(wait=False, cancel_futures=True)
         except Exception as e:
             print(f"Error scanning for host {hostname}: {e}")
         return None
+
+    def _scan_subnet(self, subnet, hostname, mac=None):
+        # eigener PortScanner pro Subnetz, da er die Ergebnisse im Objekt hält
+        scanner = self._subnet_scanner(subnet)
+        print(f"Scanning the local network for the host: {hostname} on subnet {subnet}...")
+        try:
+            scanner.scan(hosts=subnet, arguments='-sn')
+        except Exception as e:
+            print(f"Error scanning subnet {subnet}: {e}")
+            return None
+        for ip in scanner.all_hosts():
+            print(f'Scanning {self._clean_hostname(scanner[ip].hostname())} / {ip}')
+            if mac and scanner[ip]['addresses'].get('mac', 'N/A').lower() == mac.lower():
+                return ip
+            elif self._clean_hostname(scanner[ip].hostname()) == hostname:
+                return ip
+        return None
     
     def check_if_is_online(self, ip):
         """Scans the device at the given IP address using a quick scan."""
@@ -80,8 +192,9 @@ class DeviceScanner:
     def scan_device(self, ip):
         """Scans the device at the given IP address using a quick scan."""
         try:
-            self.scanner.scan(ip, arguments='-sn')
-            return self.scanner[ip]
+            with self._lock:
+                self.scanner.scan(ip, arguments='-sn')
+                return self.scanner[ip]
         except Exception as e:
             print(f"Error scanning {ip}: {e}")
             return None
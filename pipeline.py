@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Building blocks for the capture -> analysis -> broadcast pipeline.
+"""
+import threading
+import time
+import sys
+
+
+def green():
+    """'eventlet' or 'gevent' if threading is monkey patched (``gunicorn -k gevent``), else None."""
+    if 'eventlet' in sys.modules:
+        from eventlet import patcher
+        if patcher.is_monkey_patched('thread'):
+            return 'eventlet'
+    if 'gevent' in sys.modules:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            return 'gevent'
+    return None
+
+
+_GREEN = None
+
+
+def offload(fn, *args):
+    """
+    Runs a blocking call that does not yield to the event loop (OpenCV,
+    larger numpy work, multiprocessing queues) in a real OS thread when the
+    server runs on green threads, and inline otherwise. ``fn`` must not take
+    locks shared with green threads.
+    """
+    global _GREEN
+    if _GREEN is None:
+        # erst beim ersten Aufruf prüfen, dann ist der Worker bereits gepatcht
+        _GREEN = green() or False
+    if _GREEN == 'eventlet':
+        from eventlet import tpool
+        return tpool.execute(fn, *args)
+    if _GREEN == 'gevent':
+        import gevent
+        return gevent.get_hub().threadpool.apply(fn, args)
+    return fn(*args)
+
+
+# smoothed ack round trip time in seconds -> JPEG quality
+QUALITY_MAPPING = {
+    0.1: 70,
+    1: 50,
+    2: 20,
+    5: 10,
+}
+
+
+class LatestValue:
+    """Single-slot mailbox: producers overwrite, consumers always see the newest value."""
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._value = None
+        self._seq = 0
+        self._subscribers = []
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def put(self, value):
+        with self._cond:
+            self._value = value
+            self._seq += 1
+            self._cond.notify_all()
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback()
+
+    def subscribe(self, callback):
+        """``callback()`` is called after every put, in the producer's thread."""
+        with self._cond:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._cond:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def get(self):
+        with self._cond:
+            return self._seq, self._value
+
+    def wait(self, last_seq=0, timeout=None):
+        """Blocks until a value newer than ``last_seq`` is published or the timeout expires."""
+        with self._cond:
+            if self._seq == last_seq:
+                self._cond.wait(timeout)
+            return self._seq, self._value
+
+
+class PipelineStage:
+    """
+    Runs ``step`` repeatedly in its own thread.
+
+    Without a source the stage is a producer and ``step()`` is called in a loop,
+    at most once per ``interval`` seconds. With a source (a ``LatestValue``) the
+    stage is a consumer and ``step(value)`` is called for every new value; values
+    published while the step was busy are skipped and counted as dropped.
+    """
+    def __init__(self, name, step, source=None, interval=0, thread_name=None):
+        self.name = name
+        self.thread_name = thread_name or name
+        self.step = step
+        self.source = source
+        self.interval = interval
+        self.thread = None
+        self._running = None
+        self._seq = 0
+
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.last_duration = None
+        # optional: ``observe(seconds)`` for every step, e.g. a histogram
+        self.observe = None
+
+    def start(self, running):
+        self._running = running
+        self.thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+        self.thread.start()
+
+    def join(self, timeout=None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def _next_args(self):
+        if self.source is None:
+            return ()
+        seq, value = self.source.wait(self._seq, timeout=0.5)
+        if seq == self._seq:
+            return None
+        if self._seq:
+            self.dropped += seq - self._seq - 1
+        self._seq = seq
+        return (value,)
+
+    def _process(self, args):
+        start = time.perf_counter()
+        try:
+            self.step(*args)
+        except Exception as e:
+            self.errors += 1
+            print(f"Error in pipeline stage {self.name}: {e}")
+        duration = time.perf_counter() - start
+
+        self.processed += 1
+        self.busy_time += duration
+        self.last_duration = duration
+        if self.observe is not None:
+            self.observe(duration)
+        return duration
+
+    def _run(self):
+        while self._running.is_set():
+            args = self._next_args()
+            if args is None:
+                continue
+
+            duration = self._process(args)
+
+            if self.interval > duration:
+                time.sleep(self.interval - duration)
+
+    def depth(self):
+        """Number of values published to the source that this stage has not consumed yet."""
+        if self.source is None:
+            return 0
+        return self.source.seq - self._seq
+
+    def stats(self):
+        return {
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'depth': self.depth(),
+            'avg_ms': 1000 * self.busy_time / self.processed if self.processed else None,
+            'last_ms': 1000 * self.last_duration if self.last_duration is not None else None,
+            'alive': self.thread is not None and self.thread.is_alive(),
+        }
+
+
+class PooledStage(PipelineStage):
+    """
+    Consumer stage that runs on a shared executor instead of its own thread.
+
+    A new value schedules the stage unless it is already scheduled; the running
+    task then keeps consuming the newest value until it has caught up. So a
+    stage never occupies more than one worker and values arriving while it is
+    busy coalesce into the newest one, as with a dedicated thread.
+    """
+    def __init__(self, name, step, source, executor):
+        super().__init__(name, step, source=source)
+        self.executor = executor
+        self._scheduled = False
+        self._lock = threading.Lock()
+
+    def start(self, running):
+        self._running = running
+        self.source.subscribe(self._notify)
+
+    def join(self, timeout=None):
+        self.source.unsubscribe(self._notify)
+
+    def _notify(self):
+        if not self._running.is_set():
+            return
+        with self._lock:
+            if self._scheduled:
+                return
+            self._scheduled = True
+        try:
+            self.executor.submit(self._drain)
+        except RuntimeError:
+            # Executor wird gerade heruntergefahren
+            with self._lock:
+                self._scheduled = False
+
+    def _drain(self):
+        try:
+            while self._running.is_set():
+                seq, value = self.source.get()
+                if seq == self._seq:
+                    break
+                if self._seq:
+                    self.dropped += seq - self._seq - 1
+                self._seq = seq
+                self._process((value,))
+        finally:
+            with self._lock:
+                self._scheduled = False
+        # zwischen letzter Prüfung und Freigabe eingetroffene Werte nicht verlieren
+        if self.source.seq != self._seq:
+            self._notify()
+
+    def stats(self):
+        stats = super().stats()
+        stats['alive'] = self._running is not None and self._running.is_set()
+        stats['scheduled'] = self._scheduled
+        return stats
+
+
+class ClientState:
+    """
+    Credit based flow control for one viewer.
+
+    At most ``max_inflight`` frames may be unacknowledged; further frames are
+    skipped so a slow client always receives the newest frame next. The
+    quality tier follows the smoothed acknowledgement round trip time.
+    """
+    def __init__(self, **kwargs):
+        self.binary = kwargs.get('binary', False) == True
+        # Delta-Frames: nur geänderte Kacheln, immer als Binäranhang
+        self.delta = kwargs.get('delta', False) == True and self.binary
+        self.max_inflight = kwargs.get('max_inflight', 2)
+        self.ack_timeout = kwargs.get('ack_timeout', 5)
+        self.quality_mapping = kwargs.get('quality_mapping') or QUALITY_MAPPING
+        self.rtt = None
+        self.sent = 0
+        self.skipped = 0
+        # zuletzt gesendetes Vorschaubild, für das Unterdrücken unveränderter Frames
+        self.last_sent = None
+        self.reference = None
+        self.unchanged = 0
+        # Kachelreferenz des Clients und letzter Keyframe
+        self.tiles = None
+        self.key_sent = None
+        self.key_quality = None
+        self.keyframes = 0
+        self._inflight = dict()
+        self._lock = threading.Lock()
+
+    def acquire(self, frame_id):
+        """Reserves a credit for ``frame_id``; returns False if the client is saturated."""
+        now = time.perf_counter()
+        with self._lock:
+            if len(self._inflight) >= self.max_inflight:
+                # Acks of a reloaded or vanished page never arrive
+                expired = [k for k, sent_at in self._inflight.items() if now - sent_at > self.ack_timeout]
+                for k in expired:
+                    self._inflight.pop(k)
+            if len(self._inflight) >= self.max_inflight:
+                self.skipped += 1
+                return False
+            self._inflight[frame_id] = now
+            self.sent += 1
+            return True
+
+    def ack(self, frame_id, *args):
+        with self._lock:
+            sent_at = self._inflight.pop(frame_id, None)
+            if sent_at is None:
+                return
+            rtt = time.perf_counter() - sent_at
+            self.rtt = rtt if self.rtt is None else 0.8 * self.rtt + 0.2 * rtt
+
+    def quality(self):
+        tiers = sorted(self.quality_mapping.items())
+        if self.rtt is None:
+            return tiers[0][1]
+        for threshold, q in tiers:
+            if self.rtt <= threshold:
+                return q
+        return tiers[-1][1]
+
+    def stats(self):
+        return {
+            'binary': self.binary,
+            'delta': self.delta,
+            'inflight': len(self._inflight),
+            'rtt_ms': 1000 * self.rtt if self.rtt is not None else None,
+            'quality': self.quality(),
+            'sent': self.sent,
+            'skipped': self.skipped,
+            'unchanged': self.unchanged,
+            'keyframes': self.keyframes,
+        }
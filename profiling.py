@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+On-demand diagnostics of the running server: a sampling profiler and
+tracemalloc snapshots. Both cost nothing until they are started.
+"""
+import gc
+import os
+import sys
+import time
+import threading
+import tracemalloc
+import collections
+
+from pipeline import green
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of selected threads with ``sys._current_frames()``
+    and aggregates them in the collapsed format of flamegraph.pl/speedscope
+    (``thread;outer;...;inner count``). Only one profile runs at a time.
+
+    Under gevent the pipeline "threads" are greenlets, which
+    ``sys._current_frames()`` does not list; their suspended frames are
+    sampled instead. A greenlet that holds the hub is only seen once it
+    yields, so CPU bound steps show up at their next ``offload()`` or sleep.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._lock.locked()
+
+    @property
+    def supported(self):
+        # eventlet-Greenlets haben keine abfragbaren Frames über gevent.thread
+        return green() != 'eventlet'
+
+    @staticmethod
+    def _greenlets():
+        import greenlet
+        return [obj for obj in gc.get_objects() if isinstance(obj, greenlet.greenlet)]
+
+    @staticmethod
+    def _frames(greenlets):
+        """ident -> current frame of every OS thread and every suspended greenlet."""
+        frames = sys._current_frames()
+        if greenlets:
+            from gevent.thread import get_ident
+            for glet in greenlets:
+                if glet.gr_frame is not None:
+                    frames[get_ident(glet)] = glet.gr_frame
+        return frames
+
+    @staticmethod
+    def _stack(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+            frame = frame.f_back
+        return stack[::-1]
+
+    def profile(self, seconds=10, interval=0.005, prefixes=None):
+        """
+        Samples threads whose names start with one of ``prefixes`` (all
+        threads if None); returns collapsed stacks, empty if nothing matched.
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            own = threading.get_ident()
+            samples = collections.Counter()
+            gevent = green() == 'gevent'
+            greenlets, refreshed = [], 0
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                # der gc-Durchlauf ist teuer, neue Greenlets reicht es einmal pro Sekunde zu finden
+                if gevent and time.monotonic() - refreshed > 1:
+                    greenlets, refreshed = self._greenlets(), time.monotonic()
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in self._frames(greenlets).items():
+                    name = names.get(ident, str(ident))
+                    if ident == own or (prefixes and not name.startswith(tuple(prefixes))):
+                        continue
+                    samples[';'.join([name] + self._stack(frame))] += 1
+                time.sleep(interval)
+            return ''.join(f'{stack} {count}\n' for stack, count in samples.most_common())
+        finally:
+            self._lock.release()
+
+
+class AllocationTracker:
+    """
+    Before/after ``tracemalloc`` snapshots. ``start()`` turns tracing on and
+    takes the baseline, ``diff()`` compares the current heap against it and
+    ``stop()`` turns tracing off again, as it slows every allocation down.
+    """
+    def __init__(self):
+        self._baseline = None
+        self._started_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return tracemalloc.is_tracing()
+
+    def start(self, frames=10):
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+            self._baseline = tracemalloc.take_snapshot()
+            self._started_at = time.time()
+
+    def diff(self, top=20, key_type='lineno'):
+        with self._lock:
+            if self._baseline is None or not tracemalloc.is_tracing():
+                return None
+            snapshot = tracemalloc.take_snapshot()
+            stats = snapshot.compare_to(self._baseline, key_type)
+            current, peak = tracemalloc.get_traced_memory()
+            return {
+                'seconds': round(time.time() - self._started_at, 1),
+                'traced_bytes': current,
+                'peak_bytes': peak,
+                'top': [{
+                    'size_diff': stat.size_diff,
+                    'size': stat.size,
+                    'count_diff': stat.count_diff,
+                    'count': stat.count,
+                    'traceback': stat.traceback.format(),
+                } for stat in stats[:top]],
+            }
+
+    def stop(self):
+        with self._lock:
+            self._baseline = None
+            self._started_at = None
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
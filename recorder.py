@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+import os
+import json
+import wave
+import queue
+import datetime
+import threading
+import pytz
+
+from pipeline import offload
+
+
+class ClipRecorder:
+    """
+    Keeps a pre-roll of the camera's JPEG frames and raw audio chunks in memory
+    and writes it, followed by everything up to ``post_roll`` seconds after the
+    last trigger, to disk once an alert fires.
+
+    Clips are written in segments of at most ``segment`` seconds: one
+    concatenated MJPEG file (playable with ``ffplay -f mjpeg``), one WAV file
+    with the 16 bit PCM audio and a JSON index with the frame timestamps.
+    All disk I/O happens on a background writer thread with one bulk write per
+    file (through ``offload()``, so a gevent hub never waits for the disk); if the writer falls behind, segments are dropped instead of stalling
+    the capture.
+    """
+    def __init__(self, directory, **kwargs):
+        self.directory = directory
+        self.pre_roll = kwargs.get('pre_roll', 10)
+        self.post_roll = kwargs.get('post_roll', 20)
+        self.segment = kwargs.get('segment', 60)
+        self.sample_rate = kwargs.get('sample_rate', 8000)
+
+        self._frames = queue.deque()
+        self._audio = queue.deque()
+        self._clip = None
+        self._lock = threading.Lock()
+
+        self.clips = 0
+        self.segments = 0
+        self.dropped_segments = 0
+        self._queue = queue.Queue(maxsize=kwargs.get('max_pending', 8))
+        self._writer = threading.Thread(target=self._write_loop, name='recorder', daemon=True)
+        self._writer.start()
+
+    @property
+    def recording(self):
+        return self._clip is not None
+
+    def _trim(self, buffer, now):
+        while buffer and now - buffer[0][0] > self.pre_roll:
+            buffer.popleft()
+
+    def add_frame(self, timestamp, jpeg):
+        with self._lock:
+            if self._clip is None:
+                self._frames.append((timestamp, jpeg))
+                self._trim(self._frames, timestamp)
+                return
+            self._clip['frames'].append((timestamp, jpeg))
+            self._roll(timestamp)
+
+    def add_audio(self, timestamp, chunk):
+        with self._lock:
+            if self._clip is None:
+                self._audio.append((timestamp, chunk))
+                self._trim(self._audio, timestamp)
+                return
+            self._clip['audio'].append((timestamp, chunk))
+            # auch ohne Video (Stream ausgefallen) höchstens ein Segment Audio im Speicher
+            self._roll(timestamp)
+
+    def trigger(self, timestamp):
+        """Starts a clip with the pre-roll, or extends the running one."""
+        with self._lock:
+            if self._clip is None:
+                self.clips += 1
+                start = min([buffer[0][0] for buffer in (self._frames, self._audio) if buffer] + [timestamp])
+                self._clip = {
+                    'start': start,
+                    'segment_start': start,
+                    'index': 0,
+                    'frames': list(self._frames),
+                    'audio': list(self._audio),
+                }
+                self._frames.clear()
+                self._audio.clear()
+            self._clip['end'] = timestamp + self.post_roll
+
+    def tick(self, timestamp):
+        """Closes a clip whose post-roll has passed, or starts its next segment, even if no frames or audio arrive."""
+        with self._lock:
+            if self._clip is not None:
+                self._roll(timestamp)
+
+    def _roll(self, timestamp):
+        clip = self._clip
+        if timestamp > clip['end']:
+            self._flush(clip)
+            self._clip = None
+        elif timestamp - clip['segment_start'] >= self.segment:
+            self._flush(clip)
+            clip['index'] += 1
+            clip['segment_start'] = timestamp
+            clip['frames'] = []
+            clip['audio'] = []
+
+    def _flush(self, clip):
+        segment = {
+            'start': clip['start'],
+            'index': clip['index'],
+            'frames': clip['frames'],
+            'audio': clip['audio'],
+        }
+        try:
+            self._queue.put_nowait(segment)
+        except queue.Full:
+            self.dropped_segments += 1
+            print("Recorder: writer is behind, dropping segment")
+
+    def _write_loop(self):
+        while True:
+            segment = self._queue.get()
+            if segment is None:
+                break
+            try:
+                # unter gevent ist der Writer ein Greenlet: die Schreibzugriffe in einem echten Thread
+                offload(self._write, segment)
+                self.segments += 1
+            except Exception as e:
+                print(f"Error writing clip: {e}")
+
+    def _write(self, segment):
+        os.makedirs(self.directory, exist_ok=True)
+        start = datetime.datetime.fromtimestamp(segment['start'], pytz.timezone('Europe/Berlin'))
+        base = os.path.join(self.directory, f"{start.strftime('%Y%m%d-%H%M%S')}_{segment['index']:03d}")
+
+        with open(base + '.mjpeg', 'wb') as file:
+            file.write(b''.join(jpeg for _, jpeg in segment['frames']))
+
+        if segment['audio']:
+            with wave.open(base + '.wav', 'wb') as file:
+                file.setnchannels(1)
+                file.setsampwidth(2)
+                file.setframerate(self.sample_rate)
+                file.writeframes(b''.join(chunk for _, chunk in segment['audio']))
+
+        with open(base + '.json', 'w') as file:
+            json.dump({
+                'start': segment['start'],
+                'frames': [timestamp for timestamp, _ in segment['frames']],
+                'audio_start': segment['audio'][0][0] if segment['audio'] else None,
+                'sample_rate': self.sample_rate,
+            }, file)
+        print(f"Clip written: {base}")
+
+    def stats(self):
+        return {
+            'recording': self.recording,
+            'clips': self.clips,
+            'segments': self.segments,
+            'dropped_segments': self.dropped_segments,
+            'pending': self._queue.qsize(),
+        }
+
+    def close(self):
+        with self._lock:
+            if self._clip is not None:
+                self._flush(self._clip)
+                self._clip = None
+        self._queue.put(None)
+        self._writer.join(timeout=5)
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline replay of recorded streams through the alert logic.
+
+    python replay.py --clip data/clips/default/20240101-120000_000
+    python replay.py --video frames/ --fps 10 --video-thresholds 0.02,0.05,0.07
+    python replay.py --audio night.wav --audio-thresholds 0.2,0.4,0.6 --db-offsets 0,1,3
+
+Video and audio are processed in vectorized batches as fast as the CPU
+allows, and every combination of thresholds is evaluated in the same pass.
+The levels follow ``VideoAlert`` (30 s mean of the frame diff ratio) and
+``AudioAlert`` (share of the area above the alert level), so the reported
+alerts are those the live server would have raised. The timings double as
+a throughput benchmark of the detection code.
+"""
+import os
+import sys
+import json
+import time
+import wave
+import argparse
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+import pytz
+
+from alerts import blur_gray
+from frames import REDUCED_GRAYSCALE
+from streams import MjpegParser
+from denoise import StreamingDenoiser
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def read_images(path):
+    """Yields encoded images from an MJPEG file or a directory of image files."""
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                with open(os.path.join(path, name), 'rb') as file:
+                    yield file.read()
+        return
+    parser = MjpegParser()
+    with open(path, 'rb') as file:
+        while True:
+            data = file.read(1 << 20)
+            if not data:
+                break
+            yield from parser.feed(data)
+
+
+def decode_gray(data, scale=4):
+    gray = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), REDUCED_GRAYSCALE.get(scale, cv2.IMREAD_GRAYSCALE))
+    if gray is None:
+        return None
+    return blur_gray(gray, scale)
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def window_mean(times, values, window=30):
+    """Mean of ``values`` (last axis) over the last ``window`` seconds at every sample, like ``SlidingWindow``."""
+    cumsum = np.concatenate((np.zeros(values.shape[:-1] + (1,)), np.cumsum(values, axis=-1)), axis=-1)
+    hi = np.arange(1, len(times) + 1)
+    lo = np.searchsorted(times, times - window, side='left')
+    return (cumsum[..., hi] - cumsum[..., lo]) / (hi - lo)
+
+
+def window_area(times, levels, eval_times, window=30):
+    """Trapezoid area of ``levels`` over the last ``window`` seconds at every eval time, like ``SlidingArea``."""
+    if len(times) < 2:
+        return np.zeros(len(eval_times))
+    segments = np.diff(times) * (levels[1:] + levels[:-1]) / 2
+    cumsum = np.concatenate(([0.0], np.cumsum(segments)))
+    hi = np.searchsorted(times, eval_times, side='right') - 1
+    lo = np.searchsorted(times, eval_times - window, side='left')
+    return np.where(hi > lo, cumsum[np.maximum(hi, 0)] - cumsum[np.minimum(lo, len(cumsum) - 1)], 0.0)
+
+
+def episodes(times, active):
+    """(start, duration) of every run of ``active``."""
+    edges = np.diff(np.concatenate(([0], active.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    end_times = np.append(times, times[-1])[ends]
+    return [(float(times[s]), float(end_times[i] - times[s])) for i, s in enumerate(starts)]
+
+
+def _diff_ratios(grays, diff_thresholds):
+    """Diff ratio of each consecutive pair in ``grays`` for every diff threshold, shape (thresholds, pairs)."""
+    frames = np.stack(grays).astype(np.int16)
+    diffs = np.abs(np.diff(frames, axis=0))
+    return np.stack([(diffs > threshold).mean(axis=(1, 2)) for threshold in diff_thresholds])
+
+
+def analyse_video(path, timestamps=None, fps=10, scale=4, diff_thresholds=(3,), batch=64, workers=None):
+    """Returns the frame times and one row of diff ratios per diff threshold."""
+    times, ratios = [], []
+    # letzter Frame des vorherigen Batches als Referenz für den ersten des nächsten
+    last = None
+    index = 0
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for images in batched(read_images(path), batch):
+            # imdecode gibt den GIL frei, also parallel dekodieren
+            grays = executor.map(lambda data: decode_gray(data, scale), images)
+            run = [last] if last is not None else []
+            run_times = [None] if last is not None else []
+            for gray in grays:
+                timestamp = timestamps[index] if timestamps is not None and index < len(timestamps) else index / fps
+                index += 1
+                if gray is None:
+                    continue
+                if run and run[-1][1].shape != gray.shape:
+                    if len(run) > 1:
+                        times.extend(run_times[1:])
+                        ratios.append(_diff_ratios([g for _, g in run], diff_thresholds))
+                    run, run_times = [], []
+                run.append((timestamp, gray))
+                run_times.append(timestamp)
+            if len(run) > 1:
+                times.extend(run_times[1:])
+                ratios.append(_diff_ratios([g for _, g in run], diff_thresholds))
+            last = run[-1] if run else last
+    if not ratios:
+        return np.zeros(0), np.zeros((len(diff_thresholds), 0))
+    return np.asarray(times, dtype=np.float64), np.concatenate(ratios, axis=1)
+
+
+def analyse_audio(path, start=0, baseline=None, denoise=True, chunk=512, learn_seconds=6):
+    """
+    Returns chunk end times, chunk levels in dB and the baseline, as ``AudioMonitor``
+    computes them. ``chunk`` is the samples per read (1024 bytes) and
+    ``learn_seconds`` the monitor's ``duration``.
+    """
+    with wave.open(path, 'rb') as file:
+        if file.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16 bit PCM is supported")
+        sample_rate = file.getframerate()
+        channels = file.getnchannels()
+        samples = np.frombuffer(file.readframes(file.getnframes()), dtype=np.int16)
+    if channels > 1:
+        samples = samples[::channels]
+
+    # wie AudioMonitor._record_baseline: int(duration * rate / chunk) Reads zu chunk Bytes,
+    # also chunk/2 Samples je Read, bei 8 kHz 46 Chunks zu 512 Samples (2.9 s statt 6 s)
+    baseline_chunks = int(learn_seconds * sample_rate / (2 * chunk))
+    if denoise:
+        denoiser = StreamingDenoiser()
+        denoiser.learn(samples[:baseline_chunks * chunk])
+        samples = denoiser.process(samples)
+
+    n = len(samples) // chunk
+    chunks = samples[:n * chunk].reshape(n, chunk).astype(np.float64)
+    power = np.mean(np.square(chunks), axis=1)
+    times = start + (np.arange(n) + 1) * chunk / sample_rate
+    valid = power > 0
+
+    if baseline is None:
+        # RMS über die ganze Baseline-Aufnahme
+        head = power[:baseline_chunks]
+        baseline = float(10 * np.log10(np.mean(head))) if len(head) and np.mean(head) > 0 else 0.0
+    times, db = times[valid], 10 * np.log10(power[valid])
+    return times, db, baseline
+
+
+def audio_alert_levels(times, db, alertlevel, window=30):
+    """``AudioAlert`` level after every chunk: share of the area above ``alertlevel``."""
+    levels = db - alertlevel
+    above, below = levels > 0, levels < 0
+    area_above = window_area(times[above], levels[above], times, window)
+    area_below = window_area(times[below], levels[below], times, window)
+    total = np.abs(area_above) + np.abs(area_below)
+    result = np.divide(area_above, total, out=np.zeros_like(total), where=total > 0)
+    # AudioAlert wertet erst ab dem elften Chunk aus (_samples > 10)
+    result[:10] = 0
+    return result
+
+
+def parse_list(value, cast=float):
+    return [cast(v) for v in value.split(',') if v.strip()]
+
+
+def format_time(timestamp):
+    if timestamp > 1e9:
+        return datetime.datetime.fromtimestamp(timestamp, pytz.timezone('Europe/Berlin')).strftime('%Y-%m-%d %H:%M:%S')
+    return f'{timestamp:.1f}s'
+
+
+def sweep(times, levels, thresholds, **labels):
+    results = []
+    for threshold in thresholds:
+        found = episodes(times, levels > threshold) if len(times) else []
+        results.append(dict(labels, threshold=threshold, alerts=len(found),
+                            alert_seconds=round(sum(d for _, d in found), 2),
+                            episodes=[(format_time(t), round(d, 2)) for t, d in found]))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clip', help="clip written by the recorder, without extension")
+    parser.add_argument('--video', help="MJPEG file or directory of images")
+    parser.add_argument('--audio', help="16 bit PCM WAV file")
+    parser.add_argument('--fps', type=float, default=10, help="frame rate if there are no frame timestamps")
+    parser.add_argument('--scale', type=int, default=4, help="motion analysis scale")
+    parser.add_argument('--window', type=float, default=30)
+    parser.add_argument('--diff-thresholds', default='3', help="pixel diff thresholds, e.g. 3,5,8")
+    parser.add_argument('--video-thresholds', default='0.07', help="VideoAlert thresholds")
+    parser.add_argument('--audio-thresholds', default='0.4', help="AudioAlert thresholds")
+    parser.add_argument('--db-offsets', default='1', help="alert level above the baseline in dB")
+    parser.add_argument('--baseline', type=float, help="audio baseline in dB, estimated from the start if missing")
+    parser.add_argument('--no-denoise', action='store_true')
+    parser.add_argument('--batch', type=int, default=64)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    timestamps, audio_start = None, 0
+    if args.clip:
+        if os.path.exists(args.clip + '.json'):
+            with open(args.clip + '.json') as file:
+                index = json.load(file)
+            timestamps = index.get('frames')
+            audio_start = index.get('audio_start') or index.get('start') or 0
+        args.video = args.video or (args.clip + '.mjpeg' if os.path.exists(args.clip + '.mjpeg') else None)
+        args.audio = args.audio or (args.clip + '.wav' if os.path.exists(args.clip + '.wav') else None)
+    if not args.video and not args.audio:
+        parser.error("nothing to replay, give --clip, --video or --audio")
+
+    report = dict()
+    if args.video:
+        diff_thresholds = parse_list(args.diff_thresholds, int)
+        start = time.perf_counter()
+        times, ratios = analyse_video(args.video, timestamps, args.fps, args.scale, diff_thresholds,
+                                      args.batch, args.workers)
+        levels = window_mean(times, ratios, args.window) if len(times) else ratios
+        elapsed = time.perf_counter() - start
+        report['video'] = {
+            'frames': len(times) + 1 if len(times) else 0,
+            'seconds': round(elapsed, 3),
+            'fps': round((len(times) + 1) / elapsed, 1) if elapsed > 0 and len(times) else None,
+            'sweep': [result for row, diff_threshold in zip(levels, diff_thresholds)
+                      for result in sweep(times, row, parse_list(args.video_thresholds), diff_threshold=diff_threshold)],
+        }
+
+    if args.audio:
+        start = time.perf_counter()
+        times, db, baseline = analyse_audio(args.audio, audio_start, args.baseline, not args.no_denoise)
+        results = []
+        for offset in parse_list(args.db_offsets):
+            levels = audio_alert_levels(times, db, baseline + offset, args.window)
+            results += sweep(times, levels, parse_list(args.audio_thresholds), db_offset=offset)
+        elapsed = time.perf_counter() - start
+        report['audio'] = {
+            'chunks': len(times),
+            'baseline': round(baseline, 2),
+            'seconds': round(elapsed, 3),
+            'chunks_per_s': round(len(times) / elapsed, 1) if elapsed > 0 else None,
+            'sweep': results,
+        }
+
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+
+    for kind, result in report.items():
+        speed = result.get('fps') or result.get('chunks_per_s')
+        print(f"{kind}: {result.get('frames', result.get('chunks'))} in {result['seconds']}s ({speed}/s)")
+        for row in result['sweep']:
+            params = ', '.join(f'{k}={row[k]}' for k in ('diff_threshold', 'db_offset', 'threshold') if k in row)
+            print(f"  {params}: {row['alerts']} alerts, {row['alert_seconds']}s")
+            for onset, duration in row['episodes'][:10]:
+                print(f"    {onset} for {duration}s")
+
+
+if __name__ == '__main__':
+    main()
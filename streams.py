@@ -4,31 +4,58 @@
 """
 import requests
 from requests.auth import HTTPBasicAuth
+from requests.adapters import HTTPAdapter
 import numpy as np
 import cv2
 import yaml
-import datetime
+import os
 import threading
 import queue
 import time
-import pytz
-import nmap
-
-import noisereduce as nr
 
 from network import *
+from denoise import StreamingDenoiser
+from supervisor import StreamSupervisor
+from metrics import FRAME_READ, AUDIO_READ
+from pipeline import offload
 
 class ConfigReader:
-    def __init__(self, config_file):
+    def __init__(self, config_file=None, config_data=None):
         self.config_file = config_file
-        self.config_data = self.load_config()
+        self.config_data = config_data if config_data is not None else self.load_config()
 
     def load_config(self):
         with open(self.config_file, 'r') as file:
-            return yaml.safe_load(file)
+            return yaml.safe_load(file) or {}
+
+    def get_cameras(self):
+        """
+        One ConfigReader per entry of ``cameras``. Top level settings are the
+        defaults for every camera; sections (host, auth, stream, ...) are merged
+        key by key. Without ``cameras`` the file describes a single camera.
+        """
+        defaults = {k: v for k, v in self.config_data.items() if k != 'cameras'}
+        cameras = self.config_data.get('cameras') or [{}]
+        readers = []
+        for index, camera in enumerate(cameras):
+            data = dict(defaults)
+            for key, value in camera.items():
+                if isinstance(value, dict) and isinstance(data.get(key), dict):
+                    data[key] = {**data[key], **value}
+                else:
+                    data[key] = value
+            data.setdefault('name', f'cam{index}' if index else 'default')
+            readers.append(ConfigReader(self.config_file, config_data=data))
+        return readers
+
+    def get_name(self):
+        return str(self.config_data.get('name', 'default'))
     
     def get_ip(self):
         return self.config_data.get('ip', None)
+
+    def get_port(self):
+        return int(self.config_data.get('port', 80))
     
     def get_hostname(self):
         return self.config_data.get('host', {}).get('name')
@@ -42,6 +69,54 @@ class ConfigReader:
     def get_baseline(self):
         return self.config_data.get('baseline')
 
+    def get_binary_frames(self):
+        return self.config_data.get('stream', {}).get('binary', False) == True
+
+    def get_passthrough(self):
+        return self.config_data.get('stream', {}).get('passthrough', False) == True
+
+    def get_quality_mapping(self):
+        return self.config_data.get('stream', {}).get('quality_mapping')
+
+    def get_idle(self):
+        """Suppression of unchanged frames; ``enabled: false`` sends every frame."""
+        idle = {'enabled': True, 'keepalive': 5, 'scale': 8, 'diff_threshold': 8, 'min_ratio': 0.003}
+        idle.update(self.config_data.get('stream', {}).get('idle') or {})
+        return idle
+
+    def get_delta(self):
+        """Tile based delta frames; ``default: true`` switches the web page to them without ``?delta=1``."""
+        delta = {'default': False, 'cols': 8, 'rows': 6, 'keyframe': 10, 'max_share': 0.5,
+                 'diff_threshold': 8, 'min_ratio': 0.01}
+        delta.update(self.config_data.get('stream', {}).get('delta') or {})
+        return delta
+
+    def get_motion_scale(self):
+        return self.config_data.get('motion', {}).get('scale', 4)
+
+    def get_motion_threshold(self):
+        """Alert threshold of VideoAlert and the per-pixel diff threshold, calibrated for ``motion.scale``."""
+        motion = self.config_data.get('motion', {})
+        return motion.get('threshold', 0.07), motion.get('diff_threshold', 3)
+
+    def get_denoise(self):
+        return self.config_data.get('audio', {}).get('denoise', True) != False
+
+    def get_motion_processes(self):
+        return self.config_data.get('motion', {}).get('processes', 0)
+
+    def get_record(self):
+        return self.config_data.get('record') or {}
+
+    def get_history(self):
+        return self.config_data.get('history') or {}
+
+    def get_admin(self):
+        return self.config_data.get('admin') or {}
+
+    def get_workers(self):
+        return self.config_data.get('workers') or os.cpu_count() or 1
+
     def get_auth(self):
         return {
             'user': self.config_data.get('auth', {}).get('user'),
@@ -51,86 +126,200 @@ class ConfigReader:
 class CameraEntity:
     def __init__(self, **kwargs):
         self.hostname = kwargs.get('hostname')
-        self._nd = NetworkDevice(hostname=self.hostname, subnet = kwargs.get('subnet'), mac=kwargs.get('mac'))
-        self._get_ip()
+        self.name = kwargs.get('name', 'default')
+        self.port = kwargs.get('port') or 80
+        self._nd = NetworkDevice(hostname=self.hostname, subnet = kwargs.get('subnet'), mac=kwargs.get('mac'),
+                                 port=self.port)
+        # feste IP (z.B. Testkamera): keine Suche im Netz
+        self.fixed_ip = kwargs.get('ip')
+        # die Suche nach der Kamera übernehmen die Supervisoren im Hintergrund
+        self.ip = self.fixed_ip
         
         self.username = kwargs.get('username')
         self.password = kwargs.get('password')
-        self.video_url = f'http://{self.ip}/video.cgi'
-        self.video_url_auth = f'http://{self.username}:{self.password}@{self.ip}:80/video.cgi'
-        self.audio_url = f'http://{self.ip}/audio.cgi'
+        self._init_session()
         
         self.baseline = kwargs.get('baseline')
         
         self._debug = kwargs.get('debug', False) == True
+        self.passthrough = kwargs.get('passthrough', False) == True
+        # Rauschprofil bleibt über Reconnects des Audiostreams erhalten
+        self._denoiser = StreamingDenoiser() if kwargs.get('denoise', True) != False else None
+        # eine Upstream-Verbindung für Pegelmessung und alle /audio-Hörer
+        self.audio_fanout = AudioFanout()
         
         self.v = None
         self.a = None
+        self._init_supervisors()
         
-    def _get_ip(self):
-        self.ip = self._nd.get_ip()
+    def _init_session(self):
+        # Keep-Alive-Verbindungen für Audio und Health-Check
+        self.session = requests.Session()
+        self.session.auth = HTTPBasicAuth(self.username, self.password)
+        self.session.verify = False
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    # URLs folgen der zuletzt gefundenen IP
+    @property
+    def address(self):
+        return self.ip if self.port == 80 else f'{self.ip}:{self.port}'
+
+    @property
+    def video_url(self):
+        return f'http://{self.address}/video.cgi'
+
+    @property
+    def video_url_auth(self):
+        return f'http://{self.username}:{self.password}@{self.ip}:{self.port}/video.cgi'
+
+    @property
+    def audio_url(self):
+        return f'http://{self.address}/audio.cgi'
+
+    @property
+    def health_url(self):
+        return f'http://{self.address}/common/info.cgi'
     
     def init_streams(self):
-        self._init_audio_stream()
-        self._init_video_stream()
+        """Starts the background supervisors; returns immediately."""
+        self.video.start()
+        self.audio.start()
+
+    def _init_supervisors(self):
+        self.video = StreamSupervisor('video', self._connect_video, self._read_video, self._rediscover,
+                                      probe=self.is_healthy, on_state=self._on_state, camera=self.name)
+        self.audio = StreamSupervisor('audio', self._connect_audio, self._read_audio, self._rediscover,
+                                      probe=self.is_healthy, on_state=self._on_state, camera=self.name)
+        self._frame_read = FRAME_READ.labels(self.name)
+        self._state_callbacks = []
+
+    def add_state_callback(self, callback):
+        """``callback(status)`` is called with ``status()`` whenever a stream changes its state."""
+        self._state_callbacks.append(callback)
+
+    def _on_state(self, name, state):
+        status = self.status()
+        for callback in self._state_callbacks:
+            callback(status)
+
+    def _ensure_ip(self):
+        if self.ip is None:
+            self._rediscover()
+        return self.ip is not None
+
+    def _rediscover(self):
+        if self.fixed_ip:
+            return
+        ip = self._nd.get_ip(retry=False)
+        if ip:
+            self.ip = ip
         
-    def record_audio_baseline(self):
+    def record_audio_baseline(self, timeout=30):
+        deadline = time.time() + timeout
+        while self.audio.state != StreamSupervisor.LIVE or not isinstance(self.a, AudioMonitor):
+            if time.time() > deadline:
+                return False
+            time.sleep(0.2)
         self.a._record_baseline()
-        while self.a.baseline==None:
-            print("getting audio stream")
-            self._init_audio_stream()
-            self.a._record_baseline()
+        if self.a.baseline is None:
+            return False
+        # auch für Monitore nach einem Reconnect
+        self.baseline = self.a.baseline
+        return True
         
     def _init_video_stream(self):
-        self.v = VideoMonitor(self.get_video_stream())
+        if self.v is not None:
+            self.v.stop()
+        if self.passthrough:
+            self.v = MjpegMonitor(self.get_mjpeg_stream())
+        else:
+            self.v = VideoMonitor(self.get_video_stream())
     
     def _init_audio_stream(self):
-        self.a = AudioMonitor(self.get_audio_stream(), baseline=self.baseline, debug = self._debug)
-        
-    def get_frame(self):
-        frame=None
-        if isinstance(self.v,VideoMonitor):
-            frame = self.v.get_frame()
-        while isinstance(frame,type(None)):
-            self._get_ip()
-            self._init_video_stream()
-            frame = self.v.get_frame()
+        if self.a is not None:
+            self.a.close()
+        self.a = AudioMonitor(self.get_audio_stream(), baseline=self.baseline, denoiser=self._denoiser,
+                              fanout=self.audio_fanout, read_timer=AUDIO_READ.labels(self.name).observe,
+                              debug = self._debug)
+
+    def _connect_video(self):
+        if not self._ensure_ip():
+            return False
+        self._init_video_stream()
+
+    def _read_video(self):
+        start = time.perf_counter()
+        frame = self.v.get_frame()
+        if frame is not None:
+            self._frame_read.observe(time.perf_counter() - start)
         return frame
-            
-    def get_audio_data(self):
-        audio = [{'level': None}]
-        if not isinstance(self.a,AudioMonitor):
-            self._init_audio_stream()
-            
+
+    def _connect_audio(self):
+        if not self._ensure_ip():
+            return False
+        self._init_audio_stream()
+        if self.a.audio_stream is None:
+            return False
         self.a.start_monitoring()
-        audio = self.a.get_recent_audio_data()
 
-        passed = False
-        while not passed:
-            while len(audio)==0:
-                time.sleep(0.1)
-                audio = self.a.get_recent_audio_data()
+    def _read_audio(self):
+        # der AudioMonitor liest in seinem eigenen Thread, hier nur dessen Zustand prüfen
+        time.sleep(0.25)
+        if self.a.online == False or not self.a.monitor_thread.is_alive():
+            return None
+        return self.a.get_recent_audio_data()
+        
+    def wait_frame(self, last_seq=0, timeout=1):
+        """(seq, frame, stale) of a frame newer than ``last_seq``, or the last one after ``timeout``."""
+        return self.video.wait(last_seq, timeout)
             
-            passed = (audio[-1].get('level') != None) and (self.a.online==True)
-            if not passed:
-                self._get_ip()
-                self._init_audio_stream()
-                self.a.start_monitoring()
-                
-        return audio
+    def wait_audio(self, last_seq=0, timeout=1):
+        return self.audio.wait(last_seq, timeout)
+
+    def status(self):
+        return {
+            'hostname': self.hostname,
+            'ip': self.ip,
+            'video': self.video.stats(),
+            'audio': self.audio.stats(),
+        }
 
     def get_video_stream(self):
-        return cv2.VideoCapture(self.video_url_auth)
+        return offload(cv2.VideoCapture, self.video_url_auth)
+
+    def listen_audio(self):
+        """Raw audio chunks for one HTTP listener, fed from the monitor's upstream connection."""
+        self.audio.start()
+        return self.audio_fanout.listen()
+
+    def get_mjpeg_stream(self):
+        try:
+            resp = self.session.get(self.video_url, stream=True, timeout=5)
+            if resp.status_code != 200:
+                return None
+            return resp
+        except Exception as e:
+            print(f"Error retrieving video stream: {e}")
+            return None
 
     def get_audio_stream(self):
         try:
-            resp = requests.get(self.audio_url, stream=True, verify=False, timeout=5, auth=HTTPBasicAuth(self.username, self.password))
+            resp = self.session.get(self.audio_url, stream=True, timeout=5)
             if resp.status_code != 200:
                 return None
             return resp
         except Exception as e:
             print(f"Error retrieving audio stream: {e}")
             return None
+
+    def is_healthy(self):
+        try:
+            resp = self.session.get(self.health_url, timeout=2)
+            return resp.status_code == 200
+        except Exception:
+            return False
             
 class VideoMonitor:
     def __init__(self, cap):
@@ -140,7 +329,7 @@ class VideoMonitor:
 
     def get_frame(self):
         try:
-            ret, frame = self.capture.read()
+            ret, frame = offload(self.capture.read)
             if ret==False:
                 return None
             return frame
@@ -148,7 +337,207 @@ class VideoMonitor:
             return None
 
     def stop(self):
-        self.capture.release()
+        try:
+            self.capture.release()
+        except:
+            pass
+
+
+class MjpegParser:
+    """Splits a multipart MJPEG byte stream (or concatenated JPEG files) into single JPEG images."""
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        self._buffer += data
+        frames = []
+        while True:
+            start = self._buffer.find(b'\xff\xd8')
+            if start < 0:
+                # Nur Multipart-Header oder Müll, aber kein Bildanfang
+                if len(self._buffer) > 65536:
+                    del self._buffer[:-1]
+                break
+
+            # Content-Length der Multipart-Header spart die Suche nach dem Bildende
+            length = None
+            header = bytes(self._buffer[:start]).lower()
+            pos = header.rfind(b'content-length:')
+            if pos >= 0:
+                try:
+                    length = int(header[pos + 15:].split(b'\r\n', 1)[0].strip())
+                except ValueError:
+                    length = None
+
+            if length is not None:
+                if len(self._buffer) < start + length:
+                    break
+                end = start + length
+            else:
+                eoi = self._buffer.find(b'\xff\xd9', start + 2)
+                if eoi < 0:
+                    break
+                end = eoi + 2
+
+            frames.append(bytes(self._buffer[start:end]))
+            del self._buffer[:end]
+        return frames
+
+
+class MjpegMonitor:
+    """Reads the camera's MJPEG stream over HTTP and returns the original JPEG bytes without decoding."""
+    def __init__(self, stream, **kwargs):
+        if stream is None:
+            raise ValueError("Konnte den MJPEG-Stream nicht öffnen.")
+        self.stream = stream
+        self.read_size = kwargs.get('read_size', 65536)
+        self._parser = MjpegParser()
+        self._frames = queue.deque()
+        # read1 liefert sofort, was angekommen ist, statt auf read_size Bytes zu warten
+        self._read = getattr(self.stream.raw, 'read1', None) or (lambda n: self.stream.raw.read(1024))
+
+    def get_frame(self):
+        try:
+            while not self._frames:
+                data = self._read(self.read_size)
+                if not data:
+                    return None
+                self._frames.extend(self._parser.feed(data))
+            # nur das neueste Bild ist interessant
+            frame = self._frames.pop()
+            self._frames.clear()
+            return frame
+        except:
+            return None
+
+    def stop(self):
+        try:
+            self.stream.close()
+        except:
+            pass
+
+
+class AudioRingBuffer:
+    """
+    Preallocated history of audio chunk levels: epoch timestamps (float64),
+    levels relative to the alert level and absolute levels in dB (float32).
+
+    Every entry is written twice, at ``i`` and ``i + capacity``, so any window
+    of the most recent entries is one contiguous slice and reads return views
+    instead of copies. Memory use is fixed at construction.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = np.zeros(2 * capacity, dtype=np.float64)
+        self.levels = np.zeros(2 * capacity, dtype=np.float32)
+        self.db = np.zeros(2 * capacity, dtype=np.float32)
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, timestamp, level, db):
+        i = self.count % self.capacity
+        j = i + self.capacity
+        self.times[i] = self.times[j] = timestamp
+        self.levels[i] = self.levels[j] = level
+        self.db[i] = self.db[j] = db
+        # erst nach dem Schreiben sichtbar machen
+        self.count += 1
+
+    def clear(self):
+        self.count = 0
+
+    def _slice(self, n, count=None):
+        # ``count``: Stand, bis zu dem gelesen wird, sonst der aktuelle
+        count = self.count if count is None else count
+        n = max(0, min(n, count, self.capacity))
+        end = (count - 1) % self.capacity + 1 + self.capacity if count else 0
+        return slice(end - n, end)
+
+    def last(self, n, count=None):
+        """Returns (times, levels) views of the last ``n`` entries up to ``count`` entries written."""
+        window = self._slice(n, count)
+        return self.times[window], self.levels[window]
+
+    def since(self, count, end=None):
+        """Returns (times, levels) views of the entries appended after ``count`` and up to ``end`` entries had been written."""
+        end = self.count if end is None else end
+        return self.last(end - count, end)
+
+    def last_db(self, n):
+        return self.db[self._slice(n)]
+
+    def latest(self):
+        if self.count == 0:
+            return None
+        i = (self.count - 1) % self.capacity
+        return {'time': float(self.times[i]), 'level': float(self.levels[i]), 'db': float(self.db[i])}
+
+
+class AudioFanout:
+    """
+    Distributes the raw bytes of the single upstream audio connection to any
+    number of listeners. Every listener has a bounded buffer; when it is full
+    the oldest chunk is dropped, so a slow listener never stalls the reader.
+    """
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._listeners = set()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._listeners)
+
+    def subscribe(self):
+        listener = queue.Queue(maxsize=self.maxsize)
+        with self._lock:
+            self._listeners.add(listener)
+        return listener
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            self._listeners.discard(listener)
+
+    def add_callback(self, callback):
+        """``callback(data)`` is called in the reader thread for every chunk; it must not block."""
+        self._callbacks.append(callback)
+
+    def publish(self, data):
+        for callback in self._callbacks:
+            try:
+                callback(data)
+            except Exception as e:
+                print(f"Error in audio callback: {e}")
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener.put_nowait(data)
+            except queue.Full:
+                try:
+                    listener.get_nowait()
+                except queue.Empty:
+                    pass
+                self.dropped += 1
+                try:
+                    listener.put_nowait(data)
+                except queue.Full:
+                    pass
+
+    def listen(self, timeout=5):
+        """Generator over the chunks of a new listener; unsubscribes when closed."""
+        listener = self.subscribe()
+        try:
+            while True:
+                try:
+                    yield listener.get(timeout=timeout)
+                except queue.Empty:
+                    continue
+        finally:
+            self.unsubscribe(listener)
 
 
 class AudioMonitor:
@@ -161,6 +550,12 @@ class AudioMonitor:
         self.chunk = 1024  # Größe der Datenblöcke, die verarbeitet werden
         self.history_duration = 10 * 60  # 10 Minuten in Sekunden
         self.history_chunk_count = int(self.history_duration * self.sample_rate / self.chunk)
+        # None schaltet die Rauschunterdrückung ab, z.B. wenn nur RMS-Pegel gebraucht werden
+        self.denoiser = kwargs.get('denoiser')
+        self.fanout = kwargs.get('fanout')
+        self.read_timer = kwargs.get('read_timer')
+        if self.denoiser is not None:
+            self.denoiser.reset()
         self._init_queue()
         self.running = False
         self.alertlevel = None
@@ -170,15 +565,29 @@ class AudioMonitor:
         self._debug = kwargs.get('debug', False) == True
         
     def _init_queue(self):
-        self.audio_data_queue = queue.deque(maxlen=self.history_chunk_count)
+        self.audio_data = AudioRingBuffer(self.history_chunk_count)
 
-    def get_chunk(self):
+    def get_raw_chunk(self):
         if self.audio_stream==None:
             return None
-        chunk = self.audio_stream.raw.read(self.chunk)
-        chunk_buffer = np.frombuffer(chunk, dtype=np.int16)
-        chunk_denoised = nr.reduce_noise(y=chunk_buffer, sr=8000)
-        return chunk_denoised
+        start = time.perf_counter()
+        try:
+            chunk = self.audio_stream.raw.read(self.chunk)
+        except Exception:
+            return None
+        if not chunk:
+            return None
+        if self.read_timer is not None:
+            self.read_timer(time.perf_counter() - start)
+        if self.fanout is not None:
+            self.fanout.publish(chunk)
+        return np.frombuffer(chunk[:len(chunk) // 2 * 2], dtype=np.int16)
+
+    def get_chunk(self):
+        chunk_buffer = self.get_raw_chunk()
+        if chunk_buffer is None or self.denoiser is None:
+            return chunk_buffer
+        return self.denoiser.process(chunk_buffer)
 
 
     def _calculate_db(self, audio_data):
@@ -210,7 +619,12 @@ class AudioMonitor:
 
         recorded_data = self.get_recent_audio_data()
         if len(recorded_data)>num_chunks:
-            self.baseline = float(self._calculate_db([k['abs'] for k in recorded_data[num_chunks-1:]]))
+            # RMS über alle Chunks aus den Pegeln der gleich großen Chunks
+            db = recorded_data.last_db(len(recorded_data) - num_chunks + 1).astype(np.float64)
+            self.baseline = float(10 * np.log10(np.mean(10 ** (db / 10))))
+            if self.denoiser is not None:
+                # die Rohdaten der Historie sind nicht mehr da: Profil aus den nächsten Sekunden neu lernen
+                self.denoiser.relearn()
             self._init_queue()
             print(f"Baseline set to {self.baseline}")
             return
@@ -219,12 +633,17 @@ class AudioMonitor:
         audio_data = []
 
         for _ in range(num_chunks):
-            data = self.get_chunk()
+            data = self.get_raw_chunk()
             if isinstance(data, type(None)):
                 return
             audio_data.append(data)
 
         audio_data = np.concatenate(audio_data)
+        if self.denoiser is not None:
+            # Die Baseline-Aufnahme ist das Rauschprofil für alle folgenden Chunks
+            self.denoiser.learn(audio_data)
+            self.denoiser.reset()
+            audio_data = self.denoiser.process(audio_data)
         self.baseline = self._calculate_db(audio_data)
         self._init_queue()
         print(f"Baseline recorded: {self.baseline}")
@@ -242,12 +661,11 @@ class AudioMonitor:
                 continue
 
             self.alertlevel = self.baseline + self.threshold
-            self.audio_data_queue.append({'level' : float(self.current_level)-float(self.alertlevel),
-                                          'time' : datetime.datetime.now(pytz.timezone('Europe/Berlin')).isoformat(),
-                                          'abs' : audio_data,
-                                          })
+            self.audio_data.append(time.time(),
+                                   float(self.current_level)-float(self.alertlevel),
+                                   self.current_level)
             if self._debug==True:
-                print(list(self.audio_data_queue)[-1])
+                print(self.audio_data.latest())
                 print(self.alertlevel)
             
     def start_monitoring(self):
@@ -256,7 +674,7 @@ class AudioMonitor:
                 self._record_baseline()
             print("Starting audio monitoring...")
             self.running = True
-            self.monitor_thread = threading.Thread(target=self._monitor_audio)
+            self.monitor_thread = threading.Thread(target=self._monitor_audio, name='AudioMonitor', daemon=True)
             self.monitor_thread.start()
 
     def stop_monitoring(self):
@@ -265,8 +683,17 @@ class AudioMonitor:
         self.monitor_thread.join()
         print("Audio monitoring stopped.")
 
+    def close(self):
+        # Upstream-Verbindung freigeben, der Monitor-Thread endet beim nächsten Lesen
+        self.running = False
+        if self.audio_stream is not None:
+            try:
+                self.audio_stream.close()
+            except:
+                pass
+
     def get_recent_audio_data(self):
-        return list(self.audio_data_queue)
+        return self.audio_data
 
 
 if __name__ == "__main__":
@@ -277,7 +704,9 @@ if __name__ == "__main__":
                         password=conf.get_auth().get('pw'),
                         debug=True)
     self.init_streams()
-    self.a.start_monitoring()
+    while True:
+        time.sleep(5)
+        print(self.status())
     #self.a.stop_monitoring()
     # mon = AudioMonitor(self.get_audio_stream())
     # mon.monitor_audio()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+import threading
+import random
+import time
+
+from pipeline import LatestValue
+from metrics import CONNECT, REDISCOVER
+
+
+class StreamSupervisor:
+    """
+    Owns the connection of one camera stream and keeps it alive in the background.
+
+    States: ``connecting`` (first attempt), ``live`` (reading), ``degraded``
+    (reconnecting to the known IP) and ``rediscovering`` (looking for the camera
+    again after ``degraded_retries`` failed attempts, unless the optional
+    ``probe()`` shows the camera still answers). Failed attempts are
+    retried with jittered exponential backoff, so an unreachable camera costs
+    next to no CPU. Consumers never block on the connection: ``get()`` returns
+    the last good value together with a stale flag.
+    """
+    CONNECTING = 'connecting'
+    LIVE = 'live'
+    DEGRADED = 'degraded'
+    REDISCOVERING = 'rediscovering'
+
+    def __init__(self, name, connect, read, rediscover=None, **kwargs):
+        self.name = name
+        self._connect = connect
+        self._read = read
+        self._rediscover = rediscover
+        self._probe = kwargs.get('probe')
+        self.base_delay = kwargs.get('base_delay', 0.5)
+        self.max_delay = kwargs.get('max_delay', 30)
+        self.degraded_retries = kwargs.get('degraded_retries', 3)
+        self.stale_after = kwargs.get('stale_after', 5)
+        self.on_state = kwargs.get('on_state')
+        self.camera = kwargs.get('camera', 'default')
+
+        self.latest = LatestValue()
+        self.state = self.CONNECTING
+        self.attempt = 0
+        self.reconnects = 0
+        self.rediscoveries = 0
+        self.last_good = None
+        self.thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self._stop.clear()
+            self.thread = threading.Thread(target=self._run, name=f'supervisor-{self.name}', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _set_state(self, state):
+        if state == self.state:
+            return
+        self.state = state
+        print(f"Stream {self.name}: {state}")
+        if self.on_state is not None:
+            try:
+                self.on_state(self.name, state)
+            except Exception as e:
+                print(f"Error in state callback of {self.name}: {e}")
+
+    def _backoff(self):
+        delay = min(self.max_delay, self.base_delay * 2 ** max(0, self.attempt - 1))
+        return delay * random.uniform(0.5, 1.5)
+
+    def _try_connect(self):
+        start = time.perf_counter()
+        try:
+            connected = self._connect() != False
+        except Exception as e:
+            print(f"Error connecting stream {self.name}: {e}")
+            connected = False
+        CONNECT.labels(self.camera, self.name, 'ok' if connected else 'failed').observe(time.perf_counter() - start)
+        return connected
+
+    def _alive(self):
+        # antwortet die Kamera unter der bekannten Adresse, ist nur der Stream gestört: keine Suche
+        if self._probe is None:
+            return False
+        try:
+            return self._probe() == True
+        except Exception:
+            return False
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.state == self.LIVE:
+                try:
+                    value = self._read()
+                except Exception as e:
+                    print(f"Error reading stream {self.name}: {e}")
+                    value = None
+                if value is None:
+                    self.attempt = 1
+                    self._set_state(self.DEGRADED)
+                    continue
+                self.last_good = time.time()
+                self.latest.put(value)
+                continue
+
+            if self.state == self.REDISCOVERING and self._rediscover is not None and not self._alive():
+                self.rediscoveries += 1
+                start = time.perf_counter()
+                try:
+                    self._rediscover()
+                except Exception as e:
+                    print(f"Error rediscovering {self.name}: {e}")
+                REDISCOVER.labels(self.camera, self.name).observe(time.perf_counter() - start)
+
+            if self.state != self.CONNECTING:
+                self.reconnects += 1
+            if self._try_connect():
+                self.attempt = 0
+                self._set_state(self.LIVE)
+                continue
+
+            self.attempt += 1
+            if self.attempt >= self.degraded_retries:
+                self._set_state(self.REDISCOVERING)
+            elif self.state != self.CONNECTING:
+                self._set_state(self.DEGRADED)
+            self._stop.wait(self._backoff())
+
+    def is_stale(self):
+        return self.last_good is None or time.time() - self.last_good > self.stale_after
+
+    def get(self):
+        """Returns (seq, last good value, stale) without blocking."""
+        seq, value = self.latest.get()
+        return seq, value, self.is_stale()
+
+    def wait(self, last_seq=0, timeout=None):
+        """Waits at most ``timeout`` for a value newer than ``last_seq``; returns (seq, value, stale)."""
+        seq, value = self.latest.wait(last_seq, timeout)
+        return seq, value, self.is_stale()
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'stale': self.is_stale(),
+            'attempt': self.attempt,
+            'reconnects': self.reconnects,
+            'rediscoveries': self.rediscoveries,
+            'last_good': self.last_good,
+        }
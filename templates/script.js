@@ -1,4 +1,13 @@
-const socket = io();
+// Binäre Frames: per Konfiguration oder ?binary=1 / ?binary=0
+const urlBinary = new URLSearchParams(window.location.search).get('binary');
+const BINARY_FRAMES = urlBinary !== null ? urlBinary === '1' : {{ 'true' if binary else 'false' }};
+const CAMERA = '{{ camera }}';
+const API_BASE = '/api/cameras/' + encodeURIComponent(CAMERA);
+// Delta-Frames (nur geänderte Kacheln): per Konfiguration oder ?delta=1 / ?delta=0
+const urlDelta = new URLSearchParams(window.location.search).get('delta');
+const DELTA_FRAMES = (urlDelta !== null ? urlDelta === '1' : {{ 'true' if delta else 'false' }})
+    && typeof createImageBitmap === 'function';
+const socket = io({ auth: { binary: BINARY_FRAMES || DELTA_FRAMES, delta: DELTA_FRAMES, camera: CAMERA } });
 const alertLevelElement = document.getElementById('alert-level');
 const MAX_HISTORY_SECONDS = 20;
 
@@ -7,17 +16,9 @@ socket.on('connect', function() {
 });
 
 
-function fetchServerTime(callback) {
-    fetch('/api/server_time')
-        .then(response => response.json())
-        .then(data => {
-            const serverTime = new Date(data.time);
-            callback(serverTime);
-        })
-        .catch(error => console.error('Error fetching server time:', error));
-}
-
 let lastFrameTime = null;
+let lastFrameUrl = null;
+let pendingAck = null;
 
 // Formatieren des Datums
 const options = {
@@ -30,32 +31,109 @@ const options = {
     hour12: false // 24-Stunden-Format
 };
 
-socket.on('frame', function(data) {
-    // Serverzeit abrufen und dann den Frame verarbeiten
-    fetchServerTime(function(serverTime) {
-        const frameTime = new Date(data.time); // Zeit des empfangenen Frames
-        const timeDiff = (serverTime - frameTime) / 1000; // Zeitdifferenz in Sekunden
-        const formattedDate = frameTime.toLocaleString('de-DE', options); // 'de-DE' für deutsches Format
-
-        if (data.data) {
-            const videoElement = document.getElementById('video');
-            videoElement.src = 'data:image/jpeg;base64,' + data.data;
-            videoElement.style.width = '100%';
-            videoElement.style.height = 'auto';
+function renderFrame(data, ack) {
+    const videoElement = document.getElementById('video');
+    // Ein noch nicht geladener Frame wurde überholt: trotzdem bestätigen
+    if (pendingAck) {
+        pendingAck();
+    }
+    pendingAck = ack;
+    const done = function() {
+        if (pendingAck === ack) {
+            pendingAck = null;
+            ack();
+        }
+    };
+    // Bestätigung erst nach dem Dekodieren, damit die RTT die Darstellung enthält
+    videoElement.onload = done;
+    videoElement.onerror = done;
+    // die alte URL freigeben, sobald src ersetzt ist, auch wenn ihr Frame nie geladen wurde
+    const previousUrl = lastFrameUrl;
+    if (data.data instanceof ArrayBuffer || data.data instanceof Blob) {
+        // Binärer Frame: JPEG direkt als Blob anzeigen
+        const blob = new Blob([data.data], { type: 'image/jpeg' });
+        const url = URL.createObjectURL(blob);
+        videoElement.src = url;
+        lastFrameUrl = url;
+    } else {
+        videoElement.src = 'data:image/jpeg;base64,' + data.data;
+        lastFrameUrl = null;
+    }
+    if (previousUrl) {
+        URL.revokeObjectURL(previousUrl);
+    }
+    videoElement.style.width = '100%';
+    videoElement.style.height = 'auto';
+}
+
+// Kacheln werden parallel dekodiert, aber in Empfangsreihenfolge gezeichnet
+let deltaQueue = Promise.resolve();
+let deltaKeyframe = false;
+
+function decodeJpeg(data) {
+    return createImageBitmap(new Blob([data], { type: 'image/jpeg' }));
+}
+
+function renderDelta(data, ack) {
+    const canvas = document.getElementById('videoCanvas');
+    const context = canvas.getContext('2d');
+    const decoded = data.key
+        ? decodeJpeg(data.data).then(bitmap => [{ x: 0, y: 0, bitmap: bitmap }])
+        : Promise.all(data.tiles.map(tile => decodeJpeg(tile.data).then(bitmap => ({ x: tile.x, y: tile.y, bitmap: bitmap }))));
+    deltaQueue = deltaQueue.then(() => decoded).then(function(images) {
+        if (data.key) {
+            canvas.width = images[0].bitmap.width;
+            canvas.height = images[0].bitmap.height;
+            deltaKeyframe = true;
+        }
+        // Kacheln vor dem ersten Keyframe haben keinen Hintergrund
+        if (deltaKeyframe) {
+            images.forEach(image => context.drawImage(image.bitmap, image.x, image.y));
         }
+        images.forEach(image => image.bitmap.close());
+    }).catch(function(error) {
+        console.error('Delta frame:', error);
+    }).then(ack);
+}
+
+if (DELTA_FRAMES) {
+    document.getElementById('video').style.display = 'none';
+    document.getElementById('videoCanvas').style.display = 'block';
+}
 
-        lastFrameTime = frameTime;
+socket.on('frame', function(data, ack) {
+    ack = ack || function() {};
+    // Zeit des empfangenen Frames: ISO-String oder Epoch-Millisekunden (binär)
+    const frameTime = data.t !== undefined ? new Date(data.t) : new Date(data.time);
+    const formattedDate = frameTime.toLocaleString('de-DE', options); // 'de-DE' für deutsches Format
 
+    if (data.key !== undefined) {
+        renderDelta(data, ack);
+    } else if (data.data) {
+        renderFrame(data, ack);
+    } else {
+        ack();
+    }
 
-        // Lag-Anzeige immer aktualisieren
-        document.getElementById('lagDisplay').innerText = formattedDate + ' Δ' + timeDiff.toFixed(2) + 's';
+    lastFrameTime = frameTime;
 
-        const response = {
-            diff: timeDiff,
-            serverTime: serverTime
-        };
-        socket.emit('time_diff', response);
-    });
+    // Lag-Anzeige immer aktualisieren: vom Server gemessene Round-Trip-Zeit
+    const rtt = data.rtt !== null && data.rtt !== undefined ? ' Δ' + data.rtt.toFixed(2) + 's' : '';
+    document.getElementById('lagDisplay').innerText = formattedDate + rtt;
+});
+
+// KAMERASTATUS
+
+socket.on('status', function(data) {
+    const statusElement = document.getElementById('cameraStatus');
+    const video = data.video.state;
+    const audio = data.audio.state;
+    if (video === 'live' && audio === 'live') {
+        statusElement.innerText = '';
+    } else {
+        const host = data.ip ? data.ip : 'Kamera wird gesucht';
+        statusElement.innerText = host + ' | Video: ' + video + ', Audio: ' + audio;
+    }
 });
 
 // AUDIO
@@ -107,7 +185,7 @@ socket.on('disconnect', function() {
 
 // THRESHOLD SETZEN
 async function fetchThreshold() {
-    const response = await fetch('/api/get_audio_threshold');
+    const response = await fetch(API_BASE + '/get_audio_threshold');
     const data = await response.json();
     const threshold = data.threshold;
     document.getElementById('thresholdSlider').value = threshold;
@@ -115,7 +193,7 @@ async function fetchThreshold() {
 }
 
 async function setThreshold(value) {
-    const response = await fetch('/api/set_audio_threshold', {
+    const response = await fetch(API_BASE + '/set_audio_threshold', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
@@ -145,7 +223,7 @@ document.addEventListener('DOMContentLoaded', function() {
         baselinebutton.disabled = true;
         baselinebutton.style.opacity = 0.5;
 
-        fetch('/api/set_baseline', {
+        fetch(API_BASE + '/set_baseline', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -165,7 +243,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Funktion zum Umschalten des Alarms
     playButton.addEventListener('click', function() {
-        fetch('/api/alert_toggle')
+        fetch(API_BASE + '/alert_toggle')
             .then(response => response.json())
             .then(data => {
                 updateButton(data.status);
@@ -175,7 +253,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Funktion zum Laden des Alarmstatus
     function loadAlertStatus() {
-        fetch('/api/alert_is_enabled')
+        fetch(API_BASE + '/alert_is_enabled')
             .then(response => response.json())
             .then(data => {
                 updateButton(data.status);
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Append-only on-disk history of the alert levels.
+"""
+import os
+import glob
+import threading
+import numpy as np
+
+from pipeline import offload
+
+
+RECORD = np.dtype({
+    'names': ['t', 'audio', 'video', 'alert'],
+    'formats': ['<f8', '<f4', '<f4', 'u1'],
+    'offsets': [0, 8, 12, 16],
+    'itemsize': 20,
+})
+
+# eine Zeile je ``resolution`` Sekunden eines Segments
+INDEX = np.dtype([
+    ('t', '<f8'),
+    ('offset', '<u4'),
+    ('count', '<u4'),
+    ('audio_min', '<f4'), ('audio_max', '<f4'), ('audio_sum', '<f8'),
+    ('video_min', '<f4'), ('video_max', '<f4'), ('video_sum', '<f8'),
+    ('alert', 'u1'),
+])
+
+
+def _write(path, data, mode='ab'):
+    with open(path, mode) as file:
+        file.write(data)
+
+
+def _open(path, dtype):
+    count = os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    # ein abgebrochener letzter Datensatz wird ignoriert
+    return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+
+def _bucket_ids(times, start, width):
+    return np.floor((times - start) / width).astype(np.int64)
+
+
+def build_index(records, resolution=60):
+    """Summarizes time sorted records into one row per ``resolution`` seconds."""
+    if len(records) == 0:
+        return np.zeros(0, dtype=INDEX)
+    slots = np.floor(records['t'] / resolution).astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, slots[1:] != slots[:-1]])
+    counts = np.diff(np.r_[starts, len(records)])
+
+    index = np.zeros(len(starts), dtype=INDEX)
+    index['t'] = slots[starts] * resolution
+    index['offset'] = starts
+    index['count'] = counts
+    for column in ('audio', 'video'):
+        values = records[column]
+        index[f'{column}_min'] = np.minimum.reduceat(values, starts)
+        index[f'{column}_max'] = np.maximum.reduceat(values, starts)
+        index[f'{column}_sum'] = np.add.reduceat(values.astype(np.float64), starts)
+    index['alert'] = np.maximum.reduceat(records['alert'], starts)
+    return index
+
+
+class TimeSeriesStore:
+    """
+    Persistent ``(epoch, audio_level, video_diff_ratio, alert)`` history.
+
+    Records are 20 byte fixed width rows appended to one file per ``segment``
+    seconds (``<start>.dat``). A sealed segment gets a ``<start>.idx`` with one
+    min/max/sum/count row per ``resolution`` seconds, so queries over long
+    ranges aggregate index rows instead of raw samples and read cost grows
+    with the number of buckets, not with the range. Segments are read through
+    ``np.memmap``; writes are buffered and appended every ``flush_interval``
+    seconds.
+    """
+    def __init__(self, directory, **kwargs):
+        self.directory = directory
+        self.segment = kwargs.get('segment', 3600)
+        self.resolution = kwargs.get('resolution', 60)
+        self.flush_interval = kwargs.get('flush_interval', 5)
+        self.retention = kwargs.get('retention_days', 30) * 86400
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._buffer = []
+        self._current = None
+        self._last_flush = 0
+        self._indexes = dict()
+        self._lock = threading.Lock()
+
+    def _path(self, start, ext):
+        return os.path.join(self.directory, f'{int(start)}.{ext}')
+
+    def segments(self):
+        starts = [int(os.path.basename(path).split('.')[0]) for path in glob.glob(os.path.join(self.directory, '*.dat'))]
+        return sorted(starts)
+
+    def append(self, timestamp, audio, video, alert):
+        with self._lock:
+            start = timestamp - timestamp % self.segment
+            if self._current is not None and start != self._current:
+                self._flush()
+                self._seal(self._current)
+                self._expire(timestamp)
+            self._current = start
+            self._buffer.append((timestamp, audio or 0, video or 0, bool(alert)))
+            if timestamp - self._last_flush >= self.flush_interval:
+                self._flush()
+                self._last_flush = timestamp
+
+    def _flush(self):
+        if not self._buffer or self._current is None:
+            return
+        records = np.array(self._buffer, dtype=RECORD)
+        self._buffer = []
+        try:
+            # unter gevent in einem echten Thread, die Platte hält sonst den Hub an
+            offload(_write, self._path(self._current, 'dat'), records.tobytes())
+        except OSError as e:
+            print(f"Error writing history: {e}")
+
+    def _seal(self, start):
+        index = offload(build_index, _open(self._path(start, 'dat'), RECORD), self.resolution)
+        try:
+            offload(_write, self._path(start, 'idx'), index.tobytes(), 'wb')
+        except OSError as e:
+            print(f"Error writing history index: {e}")
+        self._indexes[start] = index
+        return index
+
+    def _expire(self, now):
+        for start in self.segments():
+            if start + self.segment >= now - self.retention:
+                break
+            for ext in ('dat', 'idx'):
+                if os.path.exists(self._path(start, ext)):
+                    os.remove(self._path(start, ext))
+            self._indexes.pop(start, None)
+
+    def _index(self, start):
+        index = self._indexes.get(start)
+        if index is not None:
+            return index
+        if os.path.exists(self._path(start, 'idx')):
+            index = offload(np.fromfile, self._path(start, 'idx'), INDEX)
+            self._indexes[start] = index
+            return index
+        # vor einem Neustart nicht mehr versiegelt
+        return self._seal(start)
+
+    def _pending(self):
+        with self._lock:
+            current = self._current
+            buffer = np.array(self._buffer, dtype=RECORD)
+        return current, buffer
+
+    def records(self, start, end):
+        """Raw records in ``[start, end)``."""
+        current, buffer = self._pending()
+        parts = []
+        for segment in self.segments():
+            if segment + self.segment <= start or segment >= end:
+                continue
+            records = _open(self._path(segment, 'dat'), RECORD)
+            lo, hi = np.searchsorted(records['t'], (start, end))
+            parts.append(np.array(records[lo:hi]))
+        if current is not None and len(buffer):
+            parts.append(buffer[(buffer['t'] >= start) & (buffer['t'] < end)])
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=RECORD)
+
+    def _index_rows(self, start, end):
+        current, _ = self._pending()
+        segments = set(self.segments())
+        if current is not None:
+            segments.add(current)
+        parts = []
+        for segment in sorted(segments):
+            if segment + self.segment <= start or segment >= end:
+                continue
+            if segment == current:
+                # laufendes Segment: höchstens ``segment`` Sekunden Rohdaten
+                index = build_index(self.records(max(start, segment), end), self.resolution)
+            else:
+                index = self._index(segment)
+            lo, hi = np.searchsorted(index['t'], (start, end))
+            parts.append(index[lo:hi])
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=INDEX)
+
+    def query(self, start, end, buckets=200):
+        """
+        Downsamples ``[start, end)`` into ``buckets`` equal buckets. Returns
+        columns of bucket start times and min/max/mean per level plus whether
+        an alert was active; empty buckets are None. Buckets wider than
+        ``resolution`` are built from the index, so their edges are accurate
+        to ``resolution`` seconds.
+        """
+        buckets = max(1, int(buckets))
+        width = (end - start) / buckets
+        if width >= self.resolution:
+            rows = self._index_rows(start, end)
+            times, counts = rows['t'], rows['count'].astype(np.float64)
+            columns = {c: (rows[f'{c}_min'], rows[f'{c}_max'], rows[f'{c}_sum']) for c in ('audio', 'video')}
+            alert = rows['alert']
+        else:
+            rows = self.records(start, end)
+            times, counts = rows['t'], np.ones(len(rows))
+            columns = {c: (rows[c], rows[c], rows[c].astype(np.float64)) for c in ('audio', 'video')}
+            alert = rows['alert']
+
+        result = {
+            'start': start,
+            'end': end,
+            'width': width,
+            't': (start + width * np.arange(buckets)).tolist(),
+        }
+        ids = np.clip(_bucket_ids(times, start, width), 0, buckets - 1)
+        if len(ids) == 0:
+            for c in columns:
+                for stat in ('min', 'max', 'mean'):
+                    result[f'{c}_{stat}'] = [None] * buckets
+            result['alert'] = [None] * buckets
+            return result
+
+        # Zeilen sind zeitlich sortiert, also bilden gleiche Bucket-IDs zusammenhängende Läufe
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        occupied = ids[starts]
+        n = np.add.reduceat(counts, starts)
+
+        def spread(values):
+            out = [None] * buckets
+            for i, v in zip(occupied.tolist(), values.tolist()):
+                out[i] = v
+            return out
+
+        for c, (mins, maxs, sums) in columns.items():
+            result[f'{c}_min'] = spread(np.minimum.reduceat(mins, starts))
+            result[f'{c}_max'] = spread(np.maximum.reduceat(maxs, starts))
+            result[f'{c}_mean'] = spread(np.add.reduceat(sums, starts) / n)
+        result['alert'] = spread(np.maximum.reduceat(alert, starts).astype(bool))
+        return result
+
+    def stats(self):
+        return {
+            'segments': len(self.segments()),
+            'buffered': len(self._buffer),
+            'current': self._current,
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush()